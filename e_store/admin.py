@@ -1,8 +1,14 @@
-from django.contrib import admin
-from .models import Item, Inventory, CartItem, Cart, Order, Shipping, OrderItem, BlackListedPhone, Display, Size
+from django.contrib import admin, messages
+from .models import Item, Inventory, CartItem, Cart, Order, Shipping, OrderItem, BlackListedPhone, Display, Size, OutgoingEmail
 from django.utils.html import format_html
-from django.db.models import Q, F
-from .utils import ItemType
+from django.db.models import Q, F, Sum
+from django.core.exceptions import ValidationError, PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from .utils import ItemType, set_inventories
+from .images import thumbnail_url
 
 @admin.register(Item)
 class ItemAdmin(admin.ModelAdmin):
@@ -10,7 +16,7 @@ class ItemAdmin(admin.ModelAdmin):
     readonly_fields = ('image_tag',)  # To display Image preview field
 
     def image_tag(self, obj):
-        return format_html('<img src="{}" width="50" height="50" />', obj.image.url)
+        return format_html('<img src="{}" width="50" height="50" />', thumbnail_url(obj.image))
         
     image_tag.short_description = 'Image Preview' # name of the field
 
@@ -21,7 +27,7 @@ class DisplayAdmin(admin.ModelAdmin):
     readonly_fields = ('image_tag',)
 
     def image_tag(self, obj):
-        return format_html('<img src="{}" width="50" height="50" />', obj.image.url)
+        return format_html('<img src="{}" width="50" height="50" />', thumbnail_url(obj.image))
         
     image_tag.short_description = 'Image Preview'
 
@@ -52,6 +58,22 @@ class BlacklistedPhoneAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)  # Filter by date added
 
 
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'order', 'created_at', 'attempts', 'sent_at', 'last_error')
+    list_filter = (('sent_at', admin.EmptyFieldListFilter), 'created_at')
+    search_fields = ('to', 'subject')
+    readonly_fields = ('order', 'created_at', 'sent_at', 'last_error')
+    actions = ("retry_now",)
+
+    def retry_now(self, request, queryset):
+        # Picked up by the next run of the send_emails command
+        updated = queryset.filter(sent_at__isnull=True).update(attempts=0, send_after=timezone.now())
+        self.message_user(request, f"{updated} emails will be sent by the next send_emails run.", messages.SUCCESS)
+
+    retry_now.short_description = "Retry selected emails now"
+
+
 class CartItemInline(admin.TabularInline):  
     """
     To display cart items in cart admin
@@ -68,10 +90,21 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ("id", "total_price", "created_at", "updated_at")  
-    readonly_fields = ("id", "total_price", "created_at", "updated_at", "total_price")
+    list_display = ("id", "display_total_price", "item_count", "created_at", "updated_at")  
+    readonly_fields = ("id", "total_price", "item_count", "created_at", "updated_at")
     inlines = [CartItemInline]  # Attach CartItemInline
 
+    def get_queryset(self, request):
+        # Totals of the listed carts in the same query instead of one aggregate per row
+        return super().get_queryset(request).annotate(
+            annotated_total_price=Sum(F("cartitem__quantity") * F("cartitem__item__price"))
+        )
+
+    def display_total_price(self, obj):
+        return obj.annotated_total_price or 0
+
+    display_total_price.short_description = "Total Price"
+
     def has_add_permission(self, request):
         return False
 
@@ -127,14 +160,49 @@ class OrderAdmin(admin.ModelAdmin):
 
     inlines = [OrderItemInline, ShippingInline]  # Attach Inlines
 
+    actions = ("mark_printing", "mark_shipped", "mark_delivered")
+
     def has_add_permission(self, request):
         return False
 
-    def display_total_price(self, obj):
-        if obj.status == "pending":
-            return obj.cart.total_price()
+    def change_selected_status(self, request, queryset, new_status):
+        """Bulk status change for the fulfilment workflow, see Order.bulk_change_status()."""
+        selected = queryset.count()
+        try:
+            changed = Order.bulk_change_status(queryset.values_list("id", flat=True), new_status)
+        except ValidationError as e:
+            for message in e.messages:
+                self.message_user(request, message, messages.ERROR)
+            return
 
-        return obj.total_price()
+        self.message_user(request, f"{len(changed)} orders marked as {new_status}.", messages.SUCCESS)
+        if len(changed) < selected:
+            allowed = [
+                status for status, next_statuses in Order.STATUS_FLOW.items() if new_status in next_statuses and status != new_status
+            ]
+            self.message_user(
+                request, 
+                f"{selected - len(changed)} orders skipped, only {', '.join(allowed)} orders can be marked as {new_status}.", 
+                messages.WARNING
+            )
+
+    def mark_printing(self, request, queryset):
+        self.change_selected_status(request, queryset, "printing")
+
+    mark_printing.short_description = "Mark selected orders as printing"
+
+    def mark_shipped(self, request, queryset):
+        self.change_selected_status(request, queryset, "shipped")
+
+    mark_shipped.short_description = "Mark selected orders as shipped"
+
+    def mark_delivered(self, request, queryset):
+        self.change_selected_status(request, queryset, "delivered")
+
+    mark_delivered.short_description = "Mark selected orders as delivered"
+
+    def display_total_price(self, obj):
+        return obj.total_price
 
     display_total_price.short_description = "Total Price"
     
@@ -185,7 +253,77 @@ class ShippingAdmin(admin.ModelAdmin):
         return False
 
 
-admin.site.register(Inventory)
+@admin.register(Inventory)
+class InventoryAdmin(admin.ModelAdmin):
+    list_display = ("type", "size", "quantity", "reserved_quantity")
+    list_filter = ("type", "size")
+    readonly_fields = ("reserved_quantity",)
+    change_list_template = "admin/e_store/inventory/change_list.html"
+
+    def get_urls(self):
+        urls = [
+            path("matrix/", self.admin_site.admin_view(self.matrix_view), name="e_store_inventory_matrix"),
+        ]
+        return urls + super().get_urls()
+
+    def matrix_view(self, request):
+        """
+        Edit the stock of every type x size in one form, 
+        the grid is loaded with one query and saved with bulk updates (see set_inventories()).
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+
+        item_types = list(ItemType.objects.order_by("type"))
+        sizes = list(Size.objects.order_by("id"))
+        inventories = {
+            (inventory.type_id, inventory.size_id): inventory for inventory in Inventory.objects.all()
+        }
+
+        if request.method == "POST":
+            quantities = {}
+            errors = []
+            for item_type in item_types:
+                for size in sizes:
+                    value = request.POST.get(f"quantity_{item_type.id}_{size.id}", "").strip()
+                    inventory = inventories.get((item_type.id, size.id))
+                    # Empty cells without inventory are left as they are
+                    if not value:
+                        continue
+                    try:
+                        quantity = int(value)
+                    except ValueError:
+                        errors.append(f"{item_type} - {size}: '{value}' is not a whole number.")
+                        continue
+                    if not inventory or inventory.quantity != quantity:
+                        quantities[(item_type.id, size.id)] = quantity
+
+            if not errors:
+                try:
+                    created, updated = set_inventories(quantities)
+                    self.message_user(request, f"{created} inventories created, {updated} updated.", messages.SUCCESS)
+                    return redirect("admin:e_store_inventory_matrix")
+                except ValidationError as e:
+                    errors.extend(e.messages)
+
+            for error in errors:
+                self.message_user(request, error, messages.ERROR)
+
+        rows = [
+            (item_type, [(size, inventories.get((item_type.id, size.id))) for size in sizes])
+            for item_type in item_types
+        ]
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Inventory matrix",
+            "sizes": sizes,
+            "rows": rows,
+        }
+        return TemplateResponse(request, "admin/e_store/inventory/matrix.html", context)
+
+
 admin.site.register(ItemType)
 admin.site.register(Size)
 
@@ -4,4 +4,6 @@ class EStoreConfig(AppConfig):
    default_auto_field = 'django.db.models.BigAutoField'
    name = 'e_store'
 
-    
\ No newline at end of file
+   def ready(self):
+      from . import signals  # Connect signal receivers
+      from . import checks  # Register system checks
@@ -0,0 +1,50 @@
+"""
+Blacklisted phone numbers, checked by the order form and Order.clean() on every checkout.
+
+Numbers are stored in E.164 (+213551234567) like the order phone numbers, so 0551 23 45 67 and +213551234567 match.
+The whole blacklist is kept in the cache as a frozenset, lookups are a cache get instead of a query,
+invalidate_blacklist() is connected to the save/delete signals of BlackListedPhone (see signals.py),
+the timeout only bounds how long a set missed by an invalidation can be served.
+A few thousand numbers take some kB, far from needing a Bloom filter.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from phonenumber_field.phonenumber import to_python
+
+BLACKLIST_KEY = 'blacklist:phones'
+BLACKLIST_TIMEOUT = 60 * 60
+PHONE_REGION = "DZ"  # Numbers without a country code are Algerian
+
+
+def normalize_phone(phone_number):
+	"""E.164 string of a number or PhoneNumber, the stripped input if it isn't a valid number."""
+	parsed = to_python(phone_number, region=PHONE_REGION)
+	if not parsed:
+		return ''
+	if parsed.is_valid():
+		return parsed.as_e164
+	return str(parsed.raw_input).strip()
+
+
+def blacklisted_phones():
+	phones = cache.get(BLACKLIST_KEY)
+	if phones is None:
+		from .models import BlackListedPhone
+		phones = frozenset(
+			normalize_phone(phone) for phone in BlackListedPhone.objects.values_list('phone_number', flat=True)
+		)
+		cache.set(BLACKLIST_KEY, phones, BLACKLIST_TIMEOUT)
+	return phones
+
+
+def is_blacklisted(phone_number):
+	phone = normalize_phone(phone_number)
+	return bool(phone) and phone in blacklisted_phones()
+
+
+def invalidate_blacklist(**kwargs):
+	"""
+	Signal receiver, the next lookup reloads the blacklist. Deleted once the change is committed:
+	a checkout before the commit would cache the old set again.
+	"""
+	transaction.on_commit(lambda: cache.delete(BLACKLIST_KEY))
@@ -0,0 +1,168 @@
+"""
+Cache for the catalog models (ItemType, Size, Display, Item), they only change when staff edit them in the admin.
+
+Entries are keyed on a catalog version, catalog_changed() is connected to the save/delete signals 
+of these models (see signals.py), so a new version makes every old entry unreachable instead of deleting them one by one.
+"""
+import time
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_TIMEOUT = 60 * 60 * 24  # Old versions expire on their own
+
+# Timestamps of the last catalog change and of the last stock change (reservations, see utils.py),
+# used as Last-Modified / ETag of the catalog pages (see page_cache.conditional_page)
+CATALOG_REVISION_KEY = 'catalog:revision'
+STOCK_REVISION_KEY = 'catalog:stock_revision'
+
+
+def catalog_version():
+	version = cache.get(CATALOG_VERSION_KEY)
+	if version is None:
+		# Start from the clock, a version evicted from the cache must not come back to an old number
+		cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+		version = cache.get(CATALOG_VERSION_KEY)
+	return version
+
+
+def bump_catalog_version():
+	"""Drops every cached catalog entry, only call it once the change is committed."""
+	try:
+		cache.incr(CATALOG_VERSION_KEY)
+	except ValueError:  # Key missing
+		cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+	touch_revision(CATALOG_REVISION_KEY)
+
+
+def catalog_changed(**kwargs):
+	"""
+	Signal receiver, bumps the version after the commit: a request running before it
+	would cache the old rows under the new version.
+	"""
+	transaction.on_commit(bump_catalog_version)
+
+
+def revision(key):
+	"""Timestamp of a revision key, a missing one starts from now so clients revalidate instead of getting a stale 304."""
+	value = cache.get(key)
+	if value is None:
+		cache.add(key, time.time(), None)
+		value = cache.get(key)
+	return value
+
+
+def revisions(*keys):
+	"""Timestamps of several revision keys with one cache round trip."""
+	values = cache.get_many(keys)
+	return [values[key] if key in values else revision(key) for key in keys]
+
+
+def touch_revision(key):
+	cache.set(key, time.time(), None)
+
+
+def bump_stock_revision():
+	"""Available stock changed without a catalog change, only the pages showing availability are outdated."""
+	touch_revision(STOCK_REVISION_KEY)
+
+
+def catalog_key(name):
+	return f'catalog:{catalog_version()}:{name}'
+
+
+def cached(name, load):
+	"""Return the cached value of name for the current catalog version, call load() on a miss."""
+	key = catalog_key(name)
+	value = cache.get(key)
+	if value is None:
+		value = load()
+		cache.set(key, value, CATALOG_TIMEOUT)
+	return value
+
+
+def get_displays():
+	from .models import Display
+
+	return cached('displays', lambda: list(Display.objects.select_related('type')))
+
+
+def get_item_type(slug):
+	"""ItemType for slug, None if it doesn't exist."""
+	from .utils import ItemType
+
+	item_types = cached('item_types', lambda: {item_type.slug: item_type for item_type in ItemType.objects.all()})
+	return item_types.get(slug)
+
+
+ITEM_SORTS = ('name', '-name', 'price', '-price')
+ITEMS_PAGE_SIZE = 24
+
+
+def items_cursor(item, sort):
+	"""
+	Opaque ?after= value pointing after item, signed so a tampered cursor is just ignored.
+	The sort is part of the salt, a cursor of another sort doesn't pass the signature check.
+	"""
+	field = sort.lstrip('-')
+	return signing.dumps([str(getattr(item, field)), item.id], salt=f'items-cursor:{sort}')
+
+
+def parse_items_cursor(cursor, sort):
+	"""(sort value, item id) of a cursor, None if it's missing, tampered or doesn't fit the sort field."""
+	from .models import Item
+
+	if not cursor:
+		return None
+	try:
+		value, item_id = signing.loads(cursor, salt=f'items-cursor:{sort}')
+		return Item._meta.get_field(sort.lstrip('-')).to_python(value), int(item_id)
+	except (signing.BadSignature, ValidationError, ValueError, TypeError):
+		return None
+
+
+def get_items(item_type, sort, cursor=None):
+	"""
+	One page of the items of item_type, sort must be one of ITEM_SORTS.
+	Keyset pagination: the page starts after the (sort value, id) of the cursor instead of an OFFSET, 
+	so every page is a range scan of the (type, <field>, id) indexes. Returns (items, next cursor or None).
+	"""
+	from .models import Item
+
+	field = sort.lstrip('-')
+	descending = sort.startswith('-')
+
+	after = parse_items_cursor(cursor, sort)
+	if after is None:
+		cursor = None
+
+	def load():
+		items = Item.objects.filter(type=item_type).select_related('type')
+		if after:
+			value, item_id = after
+			lookup = 'lt' if descending else 'gt'
+			items = items.filter(
+				Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'id__{lookup}': item_id})
+			)
+		items = list(items.order_by(sort, '-id' if descending else 'id')[:ITEMS_PAGE_SIZE + 1])
+
+		next_cursor = None
+		if len(items) > ITEMS_PAGE_SIZE:
+			items = items[:ITEMS_PAGE_SIZE]
+			next_cursor = items_cursor(items[-1], sort)
+		return items, next_cursor
+
+	return cached(f'items:{item_type.id}:{sort}:{cursor}', load)
+
+
+def get_item(item_id):
+	"""Item with its type, None if it doesn't exist."""
+	from .models import Item
+
+	# False is cached for missing items, None means a cache miss 
+	item = cached(f'item:{item_id}', lambda: Item.objects.select_related('type').filter(id=item_id).first() or False)
+	return item or None
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+LOCAL_CACHES = (
+	'django.core.cache.backends.locmem.LocMemCache',
+	'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+	"""
+	The catalog version, page validators and rate limits must be the same in every worker,
+	a per process cache serves stale pages and multiplies the limits by the number of workers.
+	"""
+	backend = settings.CACHES['default']['BACKEND']
+	if settings.DEBUG or backend not in LOCAL_CACHES:
+		return []
+	return [Error(
+		f"The default cache ({backend}) isn't shared between processes.",
+		hint="Use the database cache (manage.py createcachetable) or set CACHE_BACKEND to memcached or redis.",
+		id='e_store.E001',
+	)]
+
+
+@register(Tags.security, deploy=True)
+def check_rate_limits(app_configs, **kwargs):
+	if settings.DEBUG or settings.RATELIMIT_ENABLED:
+		return []
+	return [Warning(
+		"The rate limits are turned off (RATELIMIT_ENABLED=False).",
+		hint="Only turn them off on a load test server.",
+		id='e_store.W002',
+	)]
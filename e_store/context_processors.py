@@ -1,17 +1,21 @@
 from django.conf import settings
 from django.utils.translation import get_language
-from .views import cart_get_create
-from django.db.models import Sum, F
+from .views import cart_get
+from .page_cache import is_cached_page, CART_ITEM_COUNT_PLACEHOLDER, CSRF_TOKEN_PLACEHOLDER
 
 def global_context(request):
 	"""Send context to all views. Adding title here causes db error in Render"""
-	cart = cart_get_create(request)
-
-	return {
+	context = {
 		# Fix 'English' in the dropdown menu being translated
 		'LANGUAGES': settings.LANGUAGES,
 		'LANGUAGE_CODE': get_language(),
-		'cart_item_count': cart.cartitem_set.aggregate(
-			cart_item_count=Sum(F('quantity'))
-		)['cart_item_count'] or 0,
-	}	
\ No newline at end of file
+	}
+
+	if is_cached_page(request):
+		# Page rendered for the page cache, the visitor's values are put in when it's served
+		context['cart_item_count'] = CART_ITEM_COUNT_PLACEHOLDER
+		context['csrf_token'] = CSRF_TOKEN_PLACEHOLDER
+	else:
+		context['cart_item_count'] = cart_get(request).item_count
+
+	return context	
\ No newline at end of file
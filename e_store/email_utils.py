@@ -6,7 +6,10 @@ from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils.translation import gettext as _
 
-def notify_order_status_email(order):
+# The functions below only build the messages, they are queued in OutgoingEmail by Order.on_status_change()
+# and sent by the send_emails command, so no SMTP round-trip happens in the request.
+
+def store_urls(order):
     # Get the current domain
     current_site = Site.objects.get_current()
     domain = current_site.domain 
@@ -19,6 +22,12 @@ def notify_order_status_email(order):
 
     order_url = f"{http_scheme}://{domain}" + reverse("e_store:order", args=[order.id])
     store_url = f"{http_scheme}://{domain}"
+
+    return order_url, store_url
+
+def order_status_email(order):
+    """Status update message for shipped, delivered and cancelled orders, None for the other statuses."""
+    order_url, store_url = store_urls(order)
     order_link = f'<a href="{order_url}">order</a>' # Create an HTML link for "order"    
 
     # Prepare address details
@@ -31,10 +40,10 @@ def notify_order_status_email(order):
         message = _(f"Your {order_link} from <a href='{store_url}'>{store_url}</a> has been shipped to {address_city_postal_code}.")
     elif order.status == 'delivered':
         message = _(f"Your {order_link} from <a href='{store_url}'>{store_url}</a> has been delivered to {address_city_postal_code}.")
-    elif order.status == 'canceled':
+    elif order.status == 'cancelled':
         message = _(f"Your {order_link} from <a href='{store_url}'>{store_url}</a> has been canceled.")
     else:
-        return
+        return None
 
     email = order.email
 
@@ -46,18 +55,27 @@ def notify_order_status_email(order):
     )
     email_message.content_subtype = "html"  # This ensures the email is rendered as HTML
 
-    return email_message.send()
+    return email_message
+
+def order_confirmation_email(order): 
+    order_url, store_url = store_urls(order)
 
-def send_order_confirmation_email(order): 
     # Render email template
-    html_message = render_to_string("email_messages/order_confirmation_message.html", {"order": order})
+    html_message = render_to_string(
+        "email_messages/order_confirmation_message.html", 
+        {"order": order, "order_link": order_url, "store_url": store_url}
+    )
     message = strip_tags(html_message)  # Remove HTML for plain text version
 
-    email_message = EmailMessage(
+    return EmailMessage(
         subject=f"Order Confirmation - #{order.id}", 
         body=message, 
         to=[order.email]
     )
-    email_message.send()
 
+def order_email(order):
+    """Message to send for the current status of the order, None if the status has no notification."""
+    if order.status == "confirmed":
+        return order_confirmation_email(order)
 
+    return order_status_email(order)
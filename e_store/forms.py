@@ -1,9 +1,10 @@
 from django import forms
-from .models import Inventory, CartItem, Order, BlackListedPhone, OrderItem, Size
+from .models import Inventory, CartItem, Order, OrderItem, Size
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Q, F, Sum
-from .utils import available_inventory, ItemType
+from .utils import available_inventory, item_page_inventories, ItemType
+from .blacklist import is_blacklisted
 
 class AddToCartForm(forms.Form):
 	size = forms.ChoiceField(
@@ -24,19 +25,16 @@ class AddToCartForm(forms.Form):
         },
     )
 
-	def __init__(self, item, selected_size, cart, *args,  **kwargs):
+	def __init__(self, item, selected_size, cart, inventories=None, *args,  **kwargs):
+		"""inventories is the result of item_page_inventories(item, cart), loaded here if the view doesn't pass it."""
 		super().__init__(*args, **kwargs)
 		self.item = item
 		self.selected_size = selected_size
 		self.cart = cart
-		self.item_type = ItemType.objects.get(type=item.type)
-		self.size = Size.objects.filter(name=selected_size).first()
+		self.inventories = item_page_inventories(item, cart) if inventories is None else inventories
+		self.inventory = self.inventories.get(selected_size)
 
-		inventories = Inventory.objects.filter(type=self.item_type)
-		
-		sizes_quantities = {inv.size: inv.quantity for inv in inventories}
-
-		self._sizes_quantities = [(size, size, quantity) for size, quantity in sizes_quantities.items()]  # items() turn dictionary {size: quant} into tuple (size, quant)  	
+		self._sizes_quantities = [(size, size, inventory.available) for size, inventory in self.inventories.items()]
 
 		# Only available sizes are inclued in size field choices, 
 		# the frontend uses sizes_with_status() include all the sizes: unavailable sizes are crossed/greyed 
@@ -44,16 +42,9 @@ class AddToCartForm(forms.Form):
 
 		self.fields['size'].choices = choices
         
-		# Set max_value to available inventory 
-		inventory = Inventory.objects.filter(type=self.item_type, size=self.size).first()
-		if inventory:
-			cart_item = CartItem.objects.filter(item=item, inventory=inventory, cart=cart).first()
-			if cart_item:  
-				max_quantity = available_inventory(inventory) - cart_item.quantity
-				
-			else:
-				max_quantity = available_inventory(inventory)
-
+		# Set max_value to available inventory minus what is already in the cart
+		if self.inventory:
+			max_quantity = self.inventory.available - self.inventory.cart_quantity
 		else: 
 			max_quantity = 1
 		
@@ -75,15 +66,16 @@ class AddToCartForm(forms.Form):
 		size = self.cleaned_data.get('size')
 		quantity = self.cleaned_data.get('quantity')
 
-		inventory = Inventory.objects.filter(type=self.item_type, size=self.size).first()
+		inventory = self.inventory
 		if not inventory:  # Prevent AttributeError: 'NoneType' object has no attribute 'quantity', + button runs: quantity > inventory.quantity 
 			return cleaned_data
 
-		cart_item = CartItem.objects.filter(item=self.item, inventory=inventory, cart=self.cart).first()
+		if quantity is None:  # Invalid quantity, the field already has the error
+			return cleaned_data
 
 		# Prevent exceeding available inventory if cart item exists
-		if quantity and cart_item:  # Prevent AttributeError
-			if quantity + cart_item.quantity > available_inventory(inventory):
+		if quantity and inventory.cart_quantity:  # Prevent AttributeError
+			if quantity + inventory.cart_quantity > inventory.available:
 				# Add error message to quantity field
 				self.add_error('quantity', _("Available stock already in the cart."))	
 			
@@ -91,7 +83,7 @@ class AddToCartForm(forms.Form):
 				self.add_error('quantity', _('Quantity must at least be 1.'))
 		
 		else:
-			if quantity > available_inventory(inventory):
+			if quantity > inventory.available:
 				self.add_error('quantity', _("Stock unavailable, select a lower amount."))
 				
 			elif quantity < 1:
@@ -167,7 +159,7 @@ class OrderForm(forms.ModelForm):
 	def clean_phone_number(self):
 		phone_number = self.cleaned_data.get('phone_number')
 		
-		if BlackListedPhone.objects.filter(phone_number=phone_number).exists():
+		if is_blacklisted(phone_number):
 			raise ValidationError(_("This phone number has been blacklisted due to repeated order cancellations"))
 
 		return phone_number
@@ -183,13 +175,12 @@ class OrderForm(forms.ModelForm):
 				))
 			
 		# Check if inventory and item are available when creating or editing order
-		cart_items = self.cart.cartitem_set.all()
-		for cart_item in cart_items:
-			if cart_item.quantity > available_inventory(cart_item.inventory) or cart_item.inventory is None: 
-				raise ValidationError(_("One or more items in your cart are out of stock. Please review your cart."))
-
-			elif cart_item.item is None:
+		for cart_item, available in self.cart.items_with_availability():
+			if cart_item.item is None:
 				raise ValidationError(_("One or more items are no longer available, Please review your cart."))
 
+			elif cart_item.inventory is None or cart_item.quantity > available: 
+				raise ValidationError(_("One or more items in your cart are out of stock. Please review your cart."))
+
 		return cleaned_data
 
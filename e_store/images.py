@@ -0,0 +1,161 @@
+"""
+Resized copies of the uploaded images, so pages don't download the full upload to show it at 200px.
+
+Local storage (DEBUG): derivatives are generated with Pillow next to the upload,
+media/item/shirt.jpg -> media/item/derivatives/shirt_400w.webp, shirt_400w.jpg...
+They are generated when an Item or Display is saved (see signals.py) or by the build_image_derivatives command.
+
+Cloudinary (production): the same widths and formats are requested as eager transformations at upload
+(see models_cloudinary.py), so Cloudinary generates them once instead of on the first page view,
+and the delivery urls of an image are memoized in the process by public id and version.
+"""
+import io
+import os
+from functools import lru_cache
+
+from cloudinary import CloudinaryResource
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.fields.files import FieldFile
+from PIL import Image, ImageOps
+
+DERIVATIVE_WIDTHS = (200, 400, 800)
+# Format: (extension, Pillow save options)
+DERIVATIVE_FORMATS = {
+	'webp': ('webp', {'quality': 80, 'method': 4}),
+	'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+CLOUDINARY_FORMATS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def cloudinary_transformation(width, image_format):
+	# Must produce the same transformation string as the eager one for Cloudinary to serve the eager copy
+	return {'width': width, 'crop': 'limit', 'quality': 'auto', 'format': CLOUDINARY_FORMATS[image_format]}
+
+
+CLOUDINARY_EAGER = [
+	cloudinary_transformation(width, image_format) for width in DERIVATIVE_WIDTHS for image_format in DERIVATIVE_FORMATS
+]
+
+
+def derivative_name(name, width, image_format):
+	directory, filename = os.path.split(name)
+	stem = os.path.splitext(filename)[0]
+	extension = DERIVATIVE_FORMATS[image_format][0]
+	return os.path.join(directory, 'derivatives', f'{stem}_{width}w.{extension}')
+
+
+def is_local(image):
+	"""True for ImageField files (models_local), CloudinaryField images are resized by Cloudinary."""
+	return isinstance(image, FieldFile) and bool(image.name)
+
+
+# Names of the images whose derivatives were found, so a page doesn't check the storage for each image on every render.
+# Only hits are kept: a new upload gets a new name, and missing derivatives are checked again until they are built.
+DERIVATIVES_FOUND = set()
+
+
+def has_derivatives(image):
+	if image.name in DERIVATIVES_FOUND:
+		return True
+	# The smallest one is written last, see generate_derivatives()
+	if default_storage.exists(derivative_name(image.name, DERIVATIVE_WIDTHS[0], 'jpeg')):
+		DERIVATIVES_FOUND.add(image.name)
+		return True
+	return False
+
+
+def generate_derivatives(name, force=False):
+	"""
+	Write the derivatives of the image stored under name, existing ones are kept unless force.
+	Images are never upscaled, a derivative is the original size if the original is smaller than its width.
+	Top level function taking a name so it can run in a process pool. Returns the number of files written.
+	"""
+	names = [
+		(width, image_format, derivative_name(name, width, image_format))
+		for width in DERIVATIVE_WIDTHS for image_format in DERIVATIVE_FORMATS
+	]
+	if not force and all(default_storage.exists(derivative) for _, _, derivative in names):
+		return 0
+
+	with default_storage.open(name, 'rb') as f:
+		original = Image.open(f)
+		original.load()
+
+	# Apply the camera orientation, drop alpha for jpeg
+	original = ImageOps.exif_transpose(original)
+	if original.mode not in ('RGB', 'RGBA'):
+		original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+	written = 0
+	# Largest first, so has_derivatives() only sees a complete set
+	for width, image_format, derivative in sorted(names, key=lambda n: -n[0]):
+		resized = original.copy()
+		resized.thumbnail((width, width * 10), Image.LANCZOS)
+		if image_format == 'jpeg' and resized.mode != 'RGB':
+			resized = resized.convert('RGB')
+
+		content = io.BytesIO()
+		resized.save(content, format=image_format.upper(), **DERIVATIVE_FORMATS[image_format][1])
+
+		if default_storage.exists(derivative):
+			default_storage.delete(derivative)
+		default_storage.save(derivative, ContentFile(content.getvalue()))
+		written += 1
+
+	return written
+
+
+def delete_derivatives(name):
+	DERIVATIVES_FOUND.discard(name)
+	for width in DERIVATIVE_WIDTHS:
+		for image_format in DERIVATIVE_FORMATS:
+			derivative = derivative_name(name, width, image_format)
+			if default_storage.exists(derivative):
+				default_storage.delete(derivative)
+
+
+def cloudinary_urls(image):
+	"""{(width, format): delivery url} of a Cloudinary image."""
+	return build_cloudinary_urls(image.public_id, image.version, image.type, image.resource_type)
+
+
+# A public id + version never changes, so the urls are kept for good. In the process and not in the cache:
+# the default cache is the database one in production, a lookup per image would cost more than building the urls
+@lru_cache(maxsize=4096)
+def build_cloudinary_urls(public_id, version, upload_type, resource_type):
+	image = CloudinaryResource(public_id, version=version, type=upload_type, resource_type=resource_type)
+	return {
+		(width, image_format): image.build_url(**cloudinary_transformation(width, image_format))
+		for width in DERIVATIVE_WIDTHS for image_format in DERIVATIVE_FORMATS
+	}
+
+
+def srcsets(image):
+	"""{format: srcset} of an image, empty if it's a local image whose derivatives weren't generated yet."""
+	if isinstance(image, CloudinaryResource) and image.public_id:
+		urls = cloudinary_urls(image)
+		return {
+			image_format: ', '.join(f'{urls[width, image_format]} {width}w' for width in DERIVATIVE_WIDTHS)
+			for image_format in DERIVATIVE_FORMATS
+		}
+
+	if not is_local(image) or not has_derivatives(image):
+		return {}
+
+	return {
+		image_format: ', '.join(
+			f'{default_storage.url(derivative_name(image.name, width, image_format))} {width}w' for width in DERIVATIVE_WIDTHS
+		)
+		for image_format in DERIVATIVE_FORMATS
+	}
+
+
+def thumbnail_url(image):
+	"""Smallest derivative url for admin previews, the original if there is none."""
+	if isinstance(image, CloudinaryResource) and image.public_id:
+		return cloudinary_urls(image)[DERIVATIVE_WIDTHS[0], 'jpeg']
+	if is_local(image) and has_derivatives(image):
+		return default_storage.url(derivative_name(image.name, DERIVATIVE_WIDTHS[0], 'jpeg'))
+	return image.url
@@ -0,0 +1,237 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+from django.urls import reverse
+from django.utils import translation
+
+from e_store.models import Inventory, Item
+from e_store.utils import set_inventories
+
+ORDER_DATA = {
+    "first_name": "Bench",
+    "last_name": "Shopper",
+    "email": "bench@example.com",
+    "phone_number": "0555123456",
+    "address": "12 rue Didouche Mourad",
+    "city": "Algers",
+}
+ORDER_URL = re.compile(r"/order/(\d+)/$")
+PERCENTILES = (50, 95, 99)
+# Steps of a journey, in order
+ENDPOINTS = ("home", "items", "item", "add_to_cart", "cart", "create_order", "create_order_post", "confirm_order")
+
+
+def percentile(sorted_values, p):
+    # Nearest rank
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+class JourneyFailed(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the shopper journey home -> items -> item -> add to cart -> cart -> create order -> confirm "
+        "against a running server (python manage.py runserver, gunicorn...) with concurrent visitors. "
+        "Reports p50/p95/p99 per endpoint and orders per second, and saves them as JSON to compare runs. "
+        "Items are picked from the database of the current settings, it must be the one the server uses. "
+        "Run the server with RATELIMIT_ENABLED=False, every visitor comes from the same IP."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server to load.")
+        parser.add_argument("--shoppers", type=int, default=20, help="Concurrent visitors.")
+        parser.add_argument("--journeys", type=int, default=200, help="Journeys in total, each one by a new visitor.")
+        parser.add_argument(
+            "--restock",
+            type=int,
+            metavar="QUANTITY",
+            help="Set the available stock of every inventory to QUANTITY before the run, so the orders don't run out of stock.",
+        )
+        parser.add_argument("--output", help="JSON results file, defaults to benchmark-<date>.json.")
+        parser.add_argument("--compare", help="Results file of a previous run to print the differences with.")
+        parser.add_argument("--seed", type=int, help="Random seed for the items picked by the visitors.")
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds before a request fails.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.base_url = options["url"].rstrip("/")
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+        if options["restock"] is not None:
+            # On top of the units reserved by confirmed orders, which set_inventories() won't go below
+            set_inventories({
+                (type_id, size_id): options["restock"] + reserved
+                for type_id, size_id, reserved in Inventory.objects.values_list("type", "size", "reserved_quantity")
+            })
+
+        targets = self.targets()
+        if not targets:
+            raise CommandError("No item in stock, create some (create_instances) or use --restock.")
+
+        try:
+            requests.get(self.url("e_store:home"), timeout=options["timeout"])
+        except requests.RequestException as e:
+            raise CommandError(f"Server not reachable at {self.base_url}: {e}")
+
+        self.stdout.write(
+            f"{options['journeys']} journeys, {options['shoppers']} concurrent shoppers, "
+            f"{len(targets)} items/sizes in stock, against {self.base_url}..."
+        )
+        # Picked before starting so a --seed run is repeatable
+        rng = random.Random(options["seed"])
+        picks = [rng.choice(targets) for _ in range(options["journeys"])]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["shoppers"]) as executor:
+            completed = sum(executor.map(self.journey, picks))
+        duration = time.perf_counter() - start
+
+        results = self.results(duration, completed)
+        self.report(results)
+
+        output = options["output"] or f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results saved to {output}"))
+
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as f:
+                self.compare(json.load(f), results)
+
+    def targets(self):
+        """[(item id, item type slug, size name)] of the items with a size in stock."""
+        in_stock = defaultdict(list)
+        for type_id, size in (
+            Inventory.objects.filter(quantity__gt=F("reserved_quantity")).values_list("type", "size__name")
+        ):
+            in_stock[type_id].append(size)
+
+        return [
+            (item_id, type_slug, size)
+            for item_id, type_id, type_slug in Item.objects.filter(type__in=in_stock).values_list(
+                "id", "type", "type__slug"
+            )[:500]
+            for size in in_stock[type_id]
+        ]
+
+    def url(self, name, *args):
+        # Same language prefix for every visitor, the default language redirects otherwise
+        with translation.override("en"):
+            return self.base_url + reverse(name, args=args)
+
+    def request(self, session, endpoint, method, url, data=None, expected=200):
+        start = time.perf_counter()
+        try:
+            response = session.request(
+                method,
+                url,
+                data=data,
+                headers={"X-CSRFToken": session.cookies.get("csrftoken", "")} if method == "post" else None,
+                allow_redirects=False,
+                timeout=self.options["timeout"],
+            )
+        except requests.RequestException:
+            response = None
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            if response is None or response.status_code != expected:
+                self.errors[endpoint] += 1
+                raise JourneyFailed(endpoint)
+            self.timings[endpoint].append(elapsed)
+        return response
+
+    def journey(self, target):
+        """One new visitor buying one item, returns 1 if the order was confirmed."""
+        item_id, type_slug, size = target
+        with requests.Session() as session:
+            item_url = self.url("e_store:item", item_id)
+            try:
+                self.request(session, "home", "get", self.url("e_store:home"))
+                self.request(session, "items", "get", self.url("e_store:items", type_slug))
+                self.request(session, "item", "get", item_url)
+                self.request(
+                    session, "add_to_cart", "post", item_url,
+                    {"size": size, "quantity": 1, "add_to_cart": ""}, expected=302,
+                )
+                self.request(session, "cart", "get", self.url("e_store:cart"))
+                self.request(session, "create_order", "get", self.url("e_store:create_order"))
+                response = self.request(
+                    session, "create_order_post", "post", self.url("e_store:create_order"), ORDER_DATA, expected=302
+                )
+                order_id = ORDER_URL.search(response.headers.get("Location", ""))
+                if not order_id:
+                    with self.lock:
+                        self.errors["create_order_post"] += 1
+                    return 0
+
+                response = self.request(
+                    session, "confirm_order", "post", self.url("e_store:order", order_id.group(1)),
+                    {"confirm_order": order_id.group(1)}, expected=302,
+                )
+                # Sold out while ordering: redirected back to the cart
+                if "order_success" not in response.headers.get("Location", ""):
+                    with self.lock:
+                        self.errors["confirm_order"] += 1
+                    return 0
+            except JourneyFailed:
+                return 0
+        return 1
+
+    def results(self, duration, orders):
+        endpoints = {}
+        for endpoint in ENDPOINTS:
+            timings = sorted(self.timings[endpoint])
+            stats = {"requests": len(timings), "errors": self.errors[endpoint]}
+            if timings:
+                stats["mean_ms"] = round(sum(timings) / len(timings) * 1000, 2)
+                for p in PERCENTILES:
+                    stats[f"p{p}_ms"] = round(percentile(timings, p) * 1000, 2)
+            endpoints[endpoint] = stats
+
+        return {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "url": self.base_url,
+            "database": connection.vendor,
+            "shoppers": self.options["shoppers"],
+            "journeys": self.options["journeys"],
+            "duration_s": round(duration, 2),
+            "orders": orders,
+            "orders_per_second": round(orders / duration, 2),
+            "endpoints": endpoints,
+        }
+
+    def report(self, results):
+        self.stdout.write(f"\n{'endpoint':<20}{'requests':>9}{'errors':>8}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+        for endpoint, stats in results["endpoints"].items():
+            self.stdout.write(
+                f"{endpoint:<20}{stats['requests']:>9}{stats['errors']:>8}"
+                + "".join(f"{stats.get(f'p{p}_ms', '-'):>10}" for p in PERCENTILES)
+            )
+        self.stdout.write(
+            f"\n{results['orders']}/{results['journeys']} orders confirmed in {results['duration_s']}s, "
+            f"{results['orders_per_second']} orders/s"
+        )
+
+    def compare(self, before, after):
+        self.stdout.write(f"\nCompared with the run of {before['date']} (p95 ms, before -> after):")
+        for endpoint, stats in after["endpoints"].items():
+            old = before["endpoints"].get(endpoint, {}).get("p95_ms")
+            new = stats.get("p95_ms")
+            if old and new:
+                self.stdout.write(f"{endpoint:<20}{old:>10} -> {new:<10}{(new - old) / old:+.0%}")
+        self.stdout.write(f"{'orders/s':<20}{before['orders_per_second']:>10} -> {after['orders_per_second']}")
@@ -0,0 +1,62 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cloudinary.uploader
+from cloudinary import CloudinaryResource
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from e_store.images import CLOUDINARY_EAGER, generate_derivatives, is_local
+from e_store.models import Display, Item
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill the resized copies of the Item and Display images: webp/jpeg derivatives for local images, "
+        "eager transformations for Cloudinary images."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Processes, defaults to the number of CPUs.")
+        parser.add_argument("--force", action="store_true", help="Regenerate existing local derivatives.")
+
+    def handle(self, *args, **options):
+        images = [instance.image for model in (Item, Display) for instance in model.objects.only("image")]
+
+        self.build_local({image.name for image in images if is_local(image)}, options)
+        self.build_cloudinary(
+            {image.public_id for image in images if isinstance(image, CloudinaryResource) and image.public_id}
+        )
+
+    def build_local(self, names, options):
+        if not names:
+            return
+
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+
+        written = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = {executor.submit(generate_derivatives, name, options["force"]): name for name in sorted(names)}
+            for future in as_completed(futures):
+                try:
+                    written += future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{futures[future]}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"{len(names)} local images, {written} derivatives written, {failed} failed."))
+
+    def build_cloudinary(self, public_ids):
+        if not public_ids:
+            return
+
+        # Images uploaded before the eager option: ask Cloudinary to generate the transformations now
+        failed = 0
+        for public_id in sorted(public_ids):
+            try:
+                cloudinary.uploader.explicit(public_id, type="upload", eager=CLOUDINARY_EAGER, eager_async=True)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{public_id}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"{len(public_ids)} Cloudinary images, {failed} failed."))
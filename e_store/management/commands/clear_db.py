@@ -1,13 +1,5 @@
-from django.core.management.base import BaseCommand
-from e_store.models import Cart, CartItem
-from datetime import timedelta
+from e_store.management.commands.purge_expired import Command as PurgeExpiredCommand
 
-class Command(BaseCommand):
-
-	def handle(self, *args, **kwargs):
-		"""Delete carts after 30 days (session duration)."""
-		Cart.objects.filter(created_at__gte=timedelta(days=30)).delete()
-		
-		
-		
 
+class Command(PurgeExpiredCommand):
+    help = "Old name of purge_expired, kept for existing cron jobs. " + PurgeExpiredCommand.help
@@ -5,6 +5,7 @@ from decouple import config
 import cloudinary.uploader
 
 from e_store.models import ItemType, Size, Inventory, Display, Item
+from e_store.images import CLOUDINARY_EAGER
 
 User = get_user_model()
 
@@ -141,7 +142,7 @@ class Command(BaseCommand):
         ]
 
         for item_type, image_path in zip(item_types, display_images):
-            upload_result = cloudinary.uploader.upload(image_path, folder="displays/")
+            upload_result = cloudinary.uploader.upload(image_path, folder="displays/", eager=CLOUDINARY_EAGER, eager_async=True)
             Display.objects.update_or_create(
                 type=item_type,
                 defaults={"image": upload_result["public_id"]}
@@ -192,8 +193,8 @@ class Command(BaseCommand):
         for item_type, (name1, name2), (price1, price2), (img1, img2) in zip(
                 item_types, names, prices, item_images):
 
-            upload1 = cloudinary.uploader.upload(img1, folder="items/")
-            upload2 = cloudinary.uploader.upload(img2, folder="items/")
+            upload1 = cloudinary.uploader.upload(img1, folder="items/", eager=CLOUDINARY_EAGER, eager_async=True)
+            upload2 = cloudinary.uploader.upload(img2, folder="items/", eager=CLOUDINARY_EAGER, eager_async=True)
 
             Item.objects.update_or_create(
                 name=name1,
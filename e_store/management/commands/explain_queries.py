@@ -0,0 +1,95 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from e_store.catalog import ITEMS_PAGE_SIZE
+from e_store.models import Cart, CartItem, Inventory, Item, Order, OrderItem, OutgoingEmail
+from e_store.utils import ItemType, item_page_queryset
+
+# Full table scans in the plans: "Seq Scan on <table>" (PostgreSQL), "SCAN <table>" without an index (SQLite)
+SEQUENTIAL_SCAN_PATTERNS = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(r"\bSCAN (\w+)(?! USING)\s*$", re.MULTILINE),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the hot queries of the store against the current database and flag sequential scans. "
+        "Exits with an error when one is found, so it can run in CI or after a deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--planner-default",
+            action="store_true",
+            help="PostgreSQL: keep the planner settings. By default sequential scans are disabled while explaining, "
+            "so a Seq Scan in the plan means no index can serve the query, even on small tables.",
+        )
+        parser.add_argument("--verbose-plans", action="store_true", help="Print every plan, not only the flagged ones.")
+
+    def hot_queries(self):
+        """(name, queryset) of the queries run by the pages, with ids taken from the database when there are rows."""
+        cart = Cart.objects.order_by("-id").first() or Cart(id=1)
+        item = Item.objects.order_by("-id").first() or Item(id=1, type=ItemType(id=1))
+        inventory_id = Inventory.objects.values_list("id", flat=True).first() or 1
+        since = timezone.now() - timedelta(minutes=5)
+
+        return [
+            ("Pending order of a cart", Order.objects.filter(cart=cart.id, status="pending")),
+            ("Orders of a cart (order history)", Order.objects.filter(cart=cart.id).order_by("-created_at")),
+            ("Orders of an IP (spam checks)", Order.objects.filter(ip_address="127.0.0.1", created_at__gte=since)),
+            ("Cart items of a cart", CartItem.objects.filter(cart=cart.id).select_related("item", "inventory")),
+            ("Items page", Item.objects.filter(type=item.type_id).order_by("price", "id")[: ITEMS_PAGE_SIZE + 1]),
+            (
+                "Items page, next page",
+                Item.objects.filter(type=item.type_id, name__gt="m").order_by("name", "id")[: ITEMS_PAGE_SIZE + 1],
+            ),
+            ("Item page sizes and stock", item_page_queryset(item, cart)),
+            (
+                "Confirmed order items of an inventory",
+                OrderItem.objects.filter(inventory=inventory_id, order__status="confirmed"),
+            ),
+            (
+                "Outbox batch",
+                OutgoingEmail.objects.filter(sent_at__isnull=True, send_after__lte=timezone.now()).order_by("send_after"),
+            ),
+            (
+                "Cart items above their inventory (restock)",
+                CartItem.objects.filter(inventory__in=[inventory_id], quantity__gt=F("inventory__quantity")),
+            ),
+        ]
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        pattern = SEQUENTIAL_SCAN_PATTERNS.get(vendor)
+        if pattern is None:
+            self.stdout.write(self.style.WARNING(f"Sequential scans aren't detected on {vendor}, plans are only printed."))
+
+        flagged = []
+        with transaction.atomic():
+            if vendor == "postgresql" and not options["planner_default"]:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for name, queryset in self.hot_queries():
+                plan = queryset.explain()
+                tables = pattern.findall(plan) if pattern else []
+
+                if tables:
+                    flagged.append(name)
+                    self.stdout.write(self.style.ERROR(f"{name}: sequential scan on {', '.join(sorted(set(tables)))}"))
+                elif pattern:
+                    self.stdout.write(self.style.SUCCESS(f"{name}: OK"))
+                else:
+                    self.stdout.write(name)
+
+                if tables or options["verbose_plans"] or pattern is None:
+                    self.stdout.write(plan)
+
+        if flagged:
+            raise CommandError(f"{len(flagged)} hot queries do a sequential scan.")
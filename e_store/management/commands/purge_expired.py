@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from e_store.models import Cart, CartItem, Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the carts of expired sessions (with their cart items) and the expired sessions, "
+        "in small primary key batches so the tables are never locked for long. Meant to run daily from a cron job."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.SESSION_COOKIE_AGE // (60 * 60 * 24),
+            help="Delete carts not updated for this many days, defaults to the session duration.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows deleted per transaction.")
+        parser.add_argument("--sleep", type=float, default=0.5, help="Seconds to wait between batches.")
+        parser.add_argument("--dry-run", action="store_true", help="Count what would be deleted without deleting.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        carts = self.purge_carts(cutoff)
+        sessions = self.purge_sessions()
+
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {carts} carts and {sessions} sessions."))
+
+    def expired_carts(self, cutoff):
+        # The session pointing to the cart is gone, carts of an order are kept (deleting them would delete the order)
+        return Cart.objects.filter(updated_at__lt=cutoff).exclude(Exists(Order.objects.filter(cart=OuterRef("pk"))))
+
+    def purge_carts(self, cutoff):
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(
+                self.expired_carts(cutoff).filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[
+                    : self.options["batch_size"]
+                ]
+            )
+            if not ids:
+                return total
+            last_id = ids[-1]
+
+            if self.options["dry_run"]:
+                total += len(ids)
+            else:
+                with transaction.atomic():
+                    # Checked again, a cart can be used or ordered since it was selected
+                    ids = list(
+                        self.expired_carts(cutoff).filter(id__in=ids).select_for_update().values_list("id", flat=True)
+                    )
+                    CartItem.objects.filter(cart_id__in=ids).delete()
+                    total += Cart.objects.filter(id__in=ids).delete()[1].get(Cart._meta.label, 0)
+
+            self.progress("carts", total)
+
+    def purge_sessions(self):
+        total = 0
+        last_key = ""
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=timezone.now(), session_key__gt=last_key)
+                .order_by("session_key")
+                .values_list("session_key", flat=True)[: self.options["batch_size"]]
+            )
+            if not keys:
+                return total
+            last_key = keys[-1]
+
+            if self.options["dry_run"]:
+                total += len(keys)
+            else:
+                # Cached copies (cached_db engine) expire on their own at the same date
+                total += Session.objects.filter(session_key__in=keys, expire_date__lt=timezone.now()).delete()[0]
+
+            self.progress("sessions", total)
+
+    def progress(self, name, total):
+        verb = "would be deleted" if self.options["dry_run"] else "deleted"
+        self.stdout.write(f"{total} {name} {verb}...")
+        if not self.options["dry_run"]:
+            time.sleep(self.options["sleep"])
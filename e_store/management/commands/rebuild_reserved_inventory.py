@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum, F, Q
+from django.db.models.functions import Coalesce
+
+from e_store.models import Inventory, OrderItem
+
+
+class Command(BaseCommand):
+    help = "Rebuild Inventory.reserved_quantity from the order items of confirmed orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the inventories whose counter has drifted.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        confirmed_quantity = Subquery(
+            OrderItem.objects.filter(order__status="confirmed", inventory=OuterRef("pk"))
+            .values("inventory")
+            .annotate(total=Sum("quantity"))
+            .values("total")
+        )
+        inventories = Inventory.objects.annotate(expected=Coalesce(confirmed_quantity, 0))
+
+        drifted = inventories.filter(~Q(reserved_quantity=F("expected"))).select_related("type", "size")
+        for inventory in drifted:
+            self.stdout.write(
+                f"{inventory.type} - {inventory.size}: reserved {inventory.reserved_quantity}, expected {inventory.expected}"
+            )
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("Dry run, nothing was changed."))
+            return
+
+        updated = Inventory.objects.update(reserved_quantity=Coalesce(confirmed_quantity, 0))
+        self.stdout.write(self.style.SUCCESS(f"Reserved quantities rebuilt for {updated} inventories."))
@@ -0,0 +1,78 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from e_store.models import ItemType, Size
+from e_store.utils import set_inventories
+
+
+class Command(BaseCommand):
+    help = (
+        "Restock inventories from a CSV (type,size,quantity header) or JSONL "
+        '({"type": ..., "size": ..., "quantity": ...} per line) file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file, the format is picked from the extension.")
+        parser.add_argument(
+            "--add",
+            action="store_true",
+            help="Add the quantities to the current stock instead of replacing it.",
+        )
+
+    def read_rows(self, path):
+        if path.suffix in (".jsonl", ".json"):
+            with path.open(encoding="utf-8") as f:
+                for line_number, line in enumerate(f, start=1):
+                    if line.strip():
+                        yield line_number, json.loads(line)
+        else:
+            with path.open(encoding="utf-8", newline="") as f:
+                # Header is line 1
+                for line_number, row in enumerate(csv.DictReader(f), start=2):
+                    yield line_number, row
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"{path} does not exist.")
+
+        # Types can be referenced by name or slug, both tables are loaded once
+        item_types = {}
+        for item_type in ItemType.objects.all():
+            item_types[item_type.type] = item_type.id
+            item_types[item_type.slug] = item_type.id
+        sizes = dict(Size.objects.values_list("name", "id"))
+
+        quantities = {}
+        errors = []
+        for line_number, row in self.read_rows(path):
+            type_name = str(row.get("type", "")).strip()
+            size_name = str(row.get("size", "")).strip()
+            try:
+                quantity = int(row.get("quantity"))
+            except (TypeError, ValueError):
+                errors.append(f"Line {line_number}: invalid quantity '{row.get('quantity')}'.")
+                continue
+
+            if type_name not in item_types:
+                errors.append(f"Line {line_number}: unknown type '{type_name}'.")
+            elif size_name not in sizes:
+                errors.append(f"Line {line_number}: unknown size '{size_name}'.")
+            else:
+                key = (item_types[type_name], sizes[size_name])
+                # Repeated lines are summed in add mode, the last one wins otherwise
+                quantities[key] = quantities.get(key, 0) + quantity if options["add"] else quantity
+
+        if errors:
+            raise CommandError("\n".join(errors))
+
+        try:
+            created, updated = set_inventories(quantities, add=options["add"])
+        except ValidationError as e:
+            raise CommandError("\n".join(e.messages))
+
+        self.stdout.write(self.style.SUCCESS(f"{created} inventories created, {updated} updated."))
@@ -0,0 +1,82 @@
+import time
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from e_store.models import OutgoingEmail
+
+
+class Command(BaseCommand):
+    help = "Send the queued emails of the outbox in batches over one connection, failed emails are retried with a backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50, help="Emails sent per connection.")
+        parser.add_argument("--max-attempts", type=int, default=5, help="Give up on an email after this many failures.")
+        parser.add_argument(
+            "--backoff",
+            type=int,
+            default=60,
+            help="Seconds before the first retry, doubled after every failed attempt.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it is drained.",
+        )
+        parser.add_argument("--interval", type=float, default=10, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            while self.send_batch(options):
+                pass
+
+            if not options["loop"]:
+                return
+
+            time.sleep(options["interval"])
+
+    def send_batch(self, options):
+        """Send one batch, returns the number of emails taken from the outbox."""
+        with transaction.atomic():
+            # skip_locked lets several workers drain the outbox without sending an email twice
+            batch = list(
+                OutgoingEmail.objects.select_for_update(skip_locked=True)
+                .filter(sent_at__isnull=True, send_after__lte=timezone.now(), attempts__lt=options["max_attempts"])
+                .order_by("send_after", "id")[: options["batch_size"]]
+            )
+            if not batch:
+                return 0
+
+            connection = get_connection(fail_silently=False)
+            try:
+                connection.open()
+            except Exception as e:
+                # Server unreachable, the whole batch is retried later
+                for email in batch:
+                    self.failed(email, e, options)
+            else:
+                try:
+                    for email in batch:
+                        try:
+                            connection.send_messages([email.message()])
+                            email.sent_at = timezone.now()
+                        except Exception as e:
+                            self.failed(email, e, options)
+                finally:
+                    connection.close()
+
+            OutgoingEmail.objects.bulk_update(batch, ["sent_at", "attempts", "last_error", "send_after"])
+
+        sent = sum(1 for email in batch if email.sent_at)
+        self.stdout.write(f"{sent} sent, {len(batch) - sent} failed.")
+        return len(batch)
+
+    def failed(self, email, error, options):
+        email.attempts += 1
+        email.last_error = f"{type(error).__name__}: {error}"
+        email.send_after = timezone.now() + timedelta(seconds=options["backoff"] * 2 ** (email.attempts - 1))
+        if email.attempts >= options["max_attempts"]:
+            self.stderr.write(f"Giving up on email {email.id} to {email.to}: {email.last_error}")
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:16
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_reserved_quantity(apps, schema_editor):
+    Inventory = apps.get_model('e_store', 'Inventory')
+    OrderItem = apps.get_model('e_store', 'OrderItem')
+
+    confirmed_quantity = Subquery(
+        OrderItem.objects.filter(order__status='confirmed', inventory=OuterRef('pk'))
+        .values('inventory')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    Inventory.objects.update(reserved_quantity=Coalesce(confirmed_quantity, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_store', '0033_alter_display_image_alter_item_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='reserved_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_reserved_quantity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:21
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_item_count(apps, schema_editor):
+    Cart = apps.get_model('e_store', 'Cart')
+    CartItem = apps.get_model('e_store', 'CartItem')
+
+    item_count = Subquery(
+        CartItem.objects.filter(cart=OuterRef('pk'))
+        .values('cart')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    Cart.objects.update(item_count=Coalesce(item_count, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_store', '0034_inventory_reserved_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_item_count, migrations.RunPython.noop),
+    ]
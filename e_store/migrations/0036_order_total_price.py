@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:22
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_total_price(apps, schema_editor):
+    Order = apps.get_model('e_store', 'Order')
+    OrderItem = apps.get_model('e_store', 'OrderItem')
+    CartItem = apps.get_model('e_store', 'CartItem')
+
+    order_items_total = Subquery(
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum('total_price'))
+        .values('total')
+    )
+    Order.objects.exclude(status='pending').update(total_price=Coalesce(order_items_total, 0))
+
+    # Pending orders have no order items yet, use the cart
+    cart_total = Subquery(
+        CartItem.objects.filter(cart=OuterRef('cart'))
+        .values('cart')
+        .annotate(total=Sum(F('quantity') * F('item__price')))
+        .values('total')
+    )
+    Order.objects.filter(status='pending').update(total_price=Coalesce(cart_total, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_store', '0035_cart_item_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(fill_total_price, migrations.RunPython.noop),
+    ]
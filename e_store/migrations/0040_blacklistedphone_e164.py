@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:38
+
+import phonenumber_field.modelfields
+import phonenumbers
+from django.db import migrations
+
+
+def normalize_phone_numbers(apps, schema_editor):
+    # Free-form numbers to E.164, duplicates after normalizing keep the oldest entry
+    BlackListedPhone = apps.get_model('e_store', 'BlackListedPhone')
+    normalized = {}  # E.164: (pk, stored value) of the oldest entry
+    duplicates = []
+    for pk, raw in BlackListedPhone.objects.order_by('created_at', 'id').values_list('id', 'phone_number'):
+        raw = str(raw).strip()
+        try:
+            parsed = phonenumbers.parse(raw, 'DZ')
+        except phonenumbers.NumberParseException:
+            parsed = None
+        phone = phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164) \
+            if parsed and phonenumbers.is_valid_number(parsed) else raw
+
+        if phone in normalized:
+            duplicates.append(pk)
+        else:
+            normalized[phone] = (pk, raw)
+
+    # Duplicates go first so the updates don't hit the unique constraint
+    BlackListedPhone.objects.filter(pk__in=duplicates).delete()
+    for phone, (pk, raw) in normalized.items():
+        if phone != raw:
+            BlackListedPhone.objects.filter(pk=pk).update(phone_number=phone)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_store', '0039_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blacklistedphone',
+            name='phone_number',
+            field=phonenumber_field.modelfields.PhoneNumberField(max_length=128, region='DZ', unique=True),
+        ),
+        migrations.RunPython(normalize_phone_numbers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_store', '0040_blacklistedphone_e164'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_cart_status_idx',
+        ),
+    ]
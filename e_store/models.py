@@ -1,15 +1,21 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
-from django.db.models import CheckConstraint, Q, Sum, F, UniqueConstraint
+from django.db.models import CheckConstraint, Q, Sum, F, UniqueConstraint, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.formats import number_format
-from .email_utils import notify_order_status_email, send_order_confirmation_email
+from django.utils import timezone
+from django.core.mail import EmailMessage
+from .email_utils import order_email
+from .blacklist import is_blacklisted, PHONE_REGION
 from phonenumber_field.modelfields import PhoneNumberField
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, MinLengthValidator
 from django.utils.translation import gettext_lazy as _
 from cloudinary.models import CloudinaryField
 from django.conf import settings
-from .utils import available_inventory, ItemType
+from .utils import (
+	available_inventory, available_inventories, reserve_inventories, release_inventories, decrease_inventories, clamp_cart_items, ItemType
+)
 
 
 # Allow letters (including accents), spaces, hyphens, apostrophes
@@ -30,6 +36,9 @@ class Inventory(models.Model):
 	type = models.ForeignKey(ItemType, on_delete=models.CASCADE)
 	size = models.ForeignKey(Size, on_delete=models.CASCADE)
 	quantity = models.PositiveIntegerField(default=0)
+	# Quantity held by confirmed orders, updated by order status changes (see Order.update_inventory),
+	# available stock is quantity - reserved_quantity
+	reserved_quantity = models.PositiveIntegerField(default=0, editable=False)
 
 	class Meta:
 		constraints = [
@@ -39,37 +48,83 @@ class Inventory(models.Model):
 
 	def __str__(self):
 		return f"{self.type} - {self.size}: {self.quantity} in stock"
+
+	def clean(self):
+		# Confirmed orders couldn't be printed anymore (see decrease_inventories)
+		if self.quantity < self.reserved_quantity:
+			raise ValidationError({'quantity': _(
+				f"{self.reserved_quantity} are reserved by confirmed orders, the quantity can't be lower."
+			)})
 	
 	def save(self, *args, **kwargs):
 		"""Updating cart items max quantities when the inventory decreases."""  
-		inventory = Inventory.objects.filter(id=self.id).first()
-		if inventory:
-			# Check if stock decreases
-			if self.quantity < inventory.quantity:  # New quantity < old quantity
-				cart_items = CartItem.objects.filter(inventory=inventory, quantity=inventory.quantity) 
-				# Prevent setting cart items quantities to 0 
-				if self.quantity > 0:					
-					cart_items.update(quantity=self.quantity)
-
-				# Keep cart item quantity to 1 when inventory is 0, 
-				# in the templates the cart item will be disabled until the inventory is available again 
-				elif self.quantity == 0:
-					cart_items.update(quantity=1)
+		old_quantity = Inventory.objects.filter(id=self.id).values_list('quantity', flat=True).first() if self.id else None
+		if old_quantity is not None and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+			# reserved_quantity is only changed with F() updates by the checkouts, writing the whole row 
+			# would overwrite a reservation made since this instance was loaded
+			kwargs['update_fields'] = [
+				field.name for field in self._meta.concrete_fields 
+				if not field.primary_key and field.name != 'reserved_quantity'
+			]
 
 		super().save(*args, **kwargs)
 
+		if old_quantity is not None:
+			self.refresh_from_db(fields=['reserved_quantity'])
+
+			# Check if stock decreases
+			if self.quantity < old_quantity:
+				clamp_cart_items([self.id])
+
 
 class Cart(models.Model):
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
+	# Sum of the cart items quantities for the navbar badge, kept up to date by update_item_count()
+	item_count = models.PositiveIntegerField(default=0, editable=False)
 
 	def total_price(self):
+		if not self.pk:  # Carts are only saved on the first add to cart, see views.cart_get()
+			return 0
+
 		return self.cartitem_set.aggregate(
 			total_price=Sum(F('quantity') * F('item__price'))
 		)['total_price'] or 0 
 
 	def is_empty(self):
 	    return self.total_price() == 0
+
+	def clear(self):
+		"""Delete the cart items once they are ordered or the pending order is cancelled."""
+		self.cartitem_set.all().delete()
+		self.item_count = 0
+		self.updated_at = timezone.now()
+		Cart.objects.filter(id=self.id).update(item_count=0, updated_at=self.updated_at)
+
+	def update_item_count(self):
+		"""Called whenever cart items are added, changed or deleted."""
+		self.item_count = self.cartitem_set.aggregate(total=Sum('quantity'))['total'] or 0
+		self.updated_at = timezone.now()
+		Cart.objects.filter(id=self.id).update(item_count=self.item_count, updated_at=self.updated_at)
+
+		# Keep the stored total of a pending order in line with the cart
+		cart_total = self.cartitem_set.values('cart').annotate(
+			total=Sum(F('quantity') * F('item__price'))
+		).values('total')
+		Order.objects.filter(cart=self, status="pending").update(total_price=Coalesce(Subquery(cart_total), 0))
+
+	def items_with_availability(self):
+		"""
+		Return [(cart_item, available quantity)] for the whole cart, 
+		stock is read with one query for all the lines instead of one per line.
+		"""
+		if not self.pk:
+			return []
+
+		cart_items = list(self.cartitem_set.select_related('item', 'inventory__size'))
+		available = available_inventories(cart_item.inventory_id for cart_item in cart_items)
+
+		return [(cart_item, available.get(cart_item.inventory_id, 0)) for cart_item in cart_items]
 	
 
 class Order(models.Model):
@@ -163,51 +218,187 @@ class Order(models.Model):
 	city = models.CharField(_("City"), max_length=50, choices=CITIES_CHOICES)
 	# For spam
 	ip_address = models.GenericIPAddressField(null=True, blank=True)  
+	# Cart total while the order is pending (updated with the cart, see Cart.update_item_count()),
+	# order items total once it's confirmed
+	total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
-	def total_price(self):
-		return self.orderitem_set.aggregate(
-				total_price=Sum(F('total_price'))
-			)['total_price'] or 0 
-
-	def decrease_inventory(self, order_item):
-		try:
-			inventory = Inventory.objects.get(type=order_item.inventory.type, size=order_item.inventory.size)
-			print(_(f"Before: {inventory.type} - {inventory.size} has {inventory.quantity}"))
-
-			if inventory.quantity >= order_item.quantity:
-				inventory.quantity -= order_item.quantity
-				inventory.save()
-				print(_(f"After: {inventory.type} - {inventory.size} now has {inventory.quantity}"))
-
-			else:
-				raise ValueError(_(f"Not enough stock for {order_item.type} - {order_item.size}"))
+	class Meta:
+		indexes = [
+			# Pending order of a cart (cart, create_order, OrderForm.clean), partial: only the pending orders are indexed
+			models.Index(fields=['cart'], condition=Q(status='pending'), name='order_pending_cart_idx'),
+			# Orders of an IP in the last minutes (spam checks in the admin)
+			models.Index(fields=['ip_address', 'created_at'], name='order_ip_created_idx'),
+		]
 
-		except Inventory.DoesNotExist:
-			raise ValueError(f"No inventory found for {order_item.type} - {order_item.size}")
+	def inventory_quantities(self):
+		"""Return {inventory_id: quantity} for the order items, one row per inventory."""
+		return dict(
+			self.orderitem_set.filter(inventory__isnull=False).values('inventory').annotate(
+				total=Sum('quantity')
+			).values_list('inventory', 'total')
+		)
 
 	def clean(self):
 		# Check if phone number is blacklisted
-		if BlackListedPhone.objects.filter(phone_number=self.phone_number).exists():
+		if is_blacklisted(self.phone_number):
 			raise ValidationError(_("This phone number has been blacklisted due to repeated order cancellations"))
 
 		# Check if inventory and item are available before confirming order
 		if self.status == "confirmed":
-			cart_items = self.cart.cartitem_set.all()
-			for cart_item in cart_items:
-				if cart_item.quantity > available_inventory(cart_item.inventory) or cart_item.inventory is None: 
-					raise ValidationError(_(f"{cart_item.item.name} size {cart_item.inventory.size} is out of stock."))
-
-				elif cart_item.item is None:
+			for cart_item, available in self.cart.items_with_availability():
+				if cart_item.item is None:
 					raise ValidationError(_(f"{cart_item.item_name} is no longer available."))
 
+				elif cart_item.inventory is None or cart_item.quantity > available: 
+					raise ValidationError(_(f"{cart_item.item.name} size {cart_item.inventory.size} is out of stock."))
+
 		# Check if inventory and item are available before printing order
 		elif self.status == "printing":	
-			if self.orderitem_set.filter(Q(quantity__gt=F('inventory__quantity')) | Q(inventory__isnull=True)):
-				raise ValidationError(_(f"{order_item.item.name} size {order_item.inventory.size} is out of stock."))
+			order_item = self.orderitem_set.filter(
+				Q(quantity__gt=F('inventory__quantity')) | Q(inventory__isnull=True)
+			).select_related('inventory__size').first()
+			if order_item:
+				raise ValidationError(_(f"{order_item.item_name} size {order_item.inventory.size} is out of stock."))
 				
-			elif self.orderitem_set.filter(item__isnull=True):
+			order_item = self.orderitem_set.filter(item__isnull=True).first()
+			if order_item:
 				raise ValidationError(_(f"{order_item.item_name} is no longer available."))
 
+	def out_of_stock_error(self, inventory_ids):
+		"""ValidationError naming every order item whose inventory couldn't be reserved or decreased."""
+		order_items = self.orderitem_set.filter(inventory__in=inventory_ids).select_related('inventory__size')
+		return ValidationError([
+			_(f"{order_item.item_name} size {order_item.inventory.size} is out of stock.") for order_item in order_items
+		])
+
+	def update_inventory(self, old_status):
+		"""
+		Reserve stock when the order is confirmed, take it out of the inventory when the order is printed,
+		release it when a confirmed order is cancelled.
+		"""
+		if self.status == "confirmed":
+			failed = reserve_inventories(self.inventory_quantities())
+
+		elif old_status == "confirmed" and self.status == "printing":
+			failed = decrease_inventories(self.inventory_quantities())
+
+		elif old_status == "confirmed":
+			release_inventories(self.inventory_quantities())
+			failed = []
+
+		else:
+			return
+
+		if failed:
+			raise self.out_of_stock_error(failed)
+
+	def create_order_items(self):
+		"""Copy the cart items into order items when the order is confirmed, and store their total."""
+		order_items = OrderItem.objects.bulk_create([
+			OrderItem(
+				item=cart_item.item,
+				item_name=cart_item.item.name,
+				inventory_id=cart_item.inventory_id,
+				quantity=cart_item.quantity,
+				total_price=cart_item.total_price(),
+				order=self
+			)
+			for cart_item in self.cart.cartitem_set.select_related('item')
+		])
+		self.total_price = sum(order_item.total_price for order_item in order_items)
+		Order.objects.filter(id=self.id).update(total_price=self.total_price)
+
+	def on_status_change(self, old_status):
+		"""Side effects of a status change, runs in the transaction that saved the new status."""
+		if old_status == "pending" and self.status == "confirmed":
+			self.create_order_items()
+
+		# Reserve, decrease or release stock, raising ValidationError rolls back the status change 
+		self.update_inventory(old_status)
+
+		if self.status == "confirmed":
+			# Create shipping instance and clear cart when order is confirmed
+			Shipping.objects.create(order=self)
+			self.cart.clear()
+
+		elif self.status == "cancelled":
+			# Delete shipping instance when order is canceled
+			Shipping.objects.filter(order=self).delete()
+			# Delete cart items if order is "pending"
+			if old_status == "pending":
+				self.cart.clear()
+
+		# Notify customer about order status by email, the email is queued and sent by the send_emails command
+		OutgoingEmail.queue(order_email(self), order=self)
+
+	def change_status(self, new_status):
+		"""
+		Status transition without save(): the status is written with UPDATE ... WHERE id=? AND status=<current status>
+		and the side effects run in the same transaction. 
+		Raises ValidationError if STATUS_FLOW doesn't allow it, if the order was changed by another request in the meantime,
+		or if the stock can't be reserved.
+		"""
+		old_status = self.status
+		allowed_next_statuses = self.STATUS_FLOW.get(old_status, []) 
+		if new_status not in allowed_next_statuses:
+			raise ValidationError(
+				_(f"Invalid status transition from '{old_status}' to '{new_status}'. Allowed: {allowed_next_statuses}")
+			)
+
+		try:
+			with transaction.atomic():
+				if not Order.objects.filter(id=self.id, status=old_status).update(status=new_status):
+					raise ValidationError(_("This order has been updated in the meantime, please reload the page."))
+
+				self.status = new_status
+				self.on_status_change(old_status)
+
+		except ValidationError:
+			self.status = old_status
+			raise
+
+	@classmethod
+	def bulk_change_status(cls, order_ids, new_status):
+		"""
+		Move many orders to new_status in one transaction (admin actions), orders whose status doesn't allow it are skipped.
+		Printing takes the stock out of the inventory with one decrement per inventory for all the orders,
+		if one inventory is short nothing is changed. Returns the ids of the changed orders.
+		"""
+		previous_statuses = [
+			status for status, next_statuses in cls.STATUS_FLOW.items() if new_status in next_statuses and status != new_status
+		]
+
+		with transaction.atomic():
+			ids = list(
+				cls.objects.select_for_update().filter(id__in=order_ids, status__in=previous_statuses).values_list('id', flat=True)
+			)
+
+			if new_status == "printing":
+				order_item = OrderItem.objects.filter(order__in=ids, inventory__isnull=True).first()
+				if order_item:
+					raise ValidationError(_(f"Order {order_item.order_id}: {order_item.item_name} has no inventory anymore."))
+
+				quantities = dict(
+					OrderItem.objects.filter(order__in=ids).values('inventory').annotate(
+						total=Sum('quantity')
+					).values_list('inventory', 'total')
+				)
+				failed = decrease_inventories(quantities)
+				if failed:
+					raise ValidationError([
+						_(f"Not enough stock for {inventory.type} - {inventory.size}.")
+						for inventory in Inventory.objects.filter(id__in=failed).select_related('type', 'size')
+					])
+
+			cls.objects.filter(id__in=ids).update(status=new_status)
+
+			OutgoingEmail.objects.bulk_create([
+				OutgoingEmail.from_message(message, order=order)
+				for order in cls.objects.filter(id__in=ids) if (message := order_email(order))
+			])
+
+		return ids
+
 	def check_pending_order(self):
 		"""
 		Use validations that involve cart outside clean(),
@@ -220,15 +411,15 @@ class Order(models.Model):
 				)
 
 			# Check if inventory and item are available for new instance
-			cart_items = self.cart.cartitem_set.all()
-			for cart_item in cart_items:
-				if cart_item.quantity > available_inventory(cart_item.inventory) or cart_item.inventory is None: 
-					raise ValidationError(_(f"{cart_item.item.name} size {cart_item.inventory.size} is out of stock."))
-
-				elif cart_item.item is None:
+			for cart_item, available in self.cart.items_with_availability():
+				if cart_item.item is None:
 					raise ValidationError(_(f"{cart_item.item_name} is no longer available."))
 
+				elif cart_item.inventory is None or cart_item.quantity > available: 
+					raise ValidationError(_(f"{cart_item.item.name} size {cart_item.inventory.size} is out of stock."))
+
 	def save(self, *args, **kwargs):		
+		old_status = None
 		if self.id:  # Ensure the order already exists (not a new instance)
 			old_status = Order.objects.get(id=self.id).status  
 			# Enforce changing status in the correct order,
@@ -243,25 +434,20 @@ class Order(models.Model):
 						_(f"Invalid status transition from '{old_status}' to '{self.status}'. Allowed: {allowed_next_statuses}")
 					)
 
-			# Decrease inventory when changing order status to "printing":
-			if self.status == "printing":	
-				for order_item in self.orderitem_set.all():
-					self.decrease_inventory(order_item) 
-
-			# Notify customer about order status by email
-			#if old_status != self.status:  # Check if order status has changed 
-			#	if self.status == "confirmed":
-			#		send_order_confirmation_email(order=self)
-			#	elif self.status in ["shipped", "delivered", "canceled"]:
-			#		notify_order_status_email(order=self)
-			#	else:
-			#		pass
-
 		self.check_pending_order()
 		
 		self.full_clean()
 
-		super().save(*args, **kwargs)  # Call the original save method
+		with transaction.atomic():
+			# Detect a status changed by another request since old_status was read
+			if old_status and old_status != self.status:
+				if not Order.objects.filter(id=self.id, status=old_status).update(status=self.status):
+					raise ValidationError(_("This order has been updated in the meantime, please reload the page."))
+
+			super().save(*args, **kwargs)  # Call the original save method
+
+			if old_status and old_status != self.status:
+				self.on_status_change(old_status)
 
 
 
@@ -282,6 +468,13 @@ class OrderItem(models.Model):
 	total_price = models.DecimalField(max_digits=10, decimal_places=2)  
 	order = models.ForeignKey("Order", on_delete=models.CASCADE)
 
+	class Meta:
+		indexes = [
+			# Order items of an inventory joined to their order status (rebuild_reserved_inventory),
+			# the status is on Order so it can't be a partial index here
+			models.Index(fields=['inventory', 'order'], name='orderitem_inventory_order_idx'),
+		]
+
 	#def __str__(self):
 	#	return f"{self.quantity}x {self.inventory.type} ({self.inventory.size}) in Order {self.order.id}"  
 
@@ -350,6 +543,15 @@ class CartItem(models.Model):
 
 		super().save(*args, **kwargs)
 
+		self.cart.update_item_count()
+
+	def delete(self, *args, **kwargs):
+		result = super().delete(*args, **kwargs)
+
+		self.cart.update_item_count()
+
+		return result
+
 
 class Shipping(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE)
@@ -361,10 +563,63 @@ class Shipping(models.Model):
 
 
 class BlackListedPhone(models.Model):
-	phone_number = models.CharField(max_length=20, unique=True)
+	# Stored in E.164 like the order numbers, see blacklist.py
+	phone_number = PhoneNumberField(unique=True, region=PHONE_REGION)
 	reason = models.TextField(null=True, blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
 	def __str__(self):
-		return self.phone_number
\ No newline at end of file
+		return str(self.phone_number)
+
+
+class OutgoingEmail(models.Model):
+	"""
+	Outbox: emails are saved in the transaction that changes the order status 
+	and sent later in batches by the send_emails command, which retries failed emails with a backoff.
+	"""
+	order = models.ForeignKey(Order, null=True, blank=True, on_delete=models.SET_NULL)
+	# Comma separated addresses
+	to = models.CharField(max_length=254)
+	subject = models.CharField(max_length=255)
+	body = models.TextField()
+	content_subtype = models.CharField(max_length=20, default="plain")
+	created_at = models.DateTimeField(auto_now_add=True)
+	# Not sent before this time, pushed back after every failed attempt
+	send_after = models.DateTimeField(default=timezone.now)
+	attempts = models.PositiveIntegerField(default=0)
+	last_error = models.TextField(blank=True)
+	sent_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		indexes = [
+			# Queue lookups of the worker only go through the unsent emails
+			models.Index(fields=['send_after'], condition=Q(sent_at__isnull=True), name='outgoingemail_unsent_idx'),
+		]
+
+	def __str__(self):
+		return f"{self.subject} to {self.to}"
+
+	@classmethod
+	def from_message(cls, message, order=None):
+		return cls(
+			order=order, 
+			to=", ".join(message.to), 
+			subject=message.subject, 
+			body=message.body, 
+			content_subtype=message.content_subtype,
+		)
+
+	@classmethod
+	def queue(cls, message, order=None):
+		if message is None:
+			return None
+
+		email = cls.from_message(message, order=order)
+		email.save()
+		return email
+
+	def message(self):
+		message = EmailMessage(subject=self.subject, body=self.body, to=self.to.split(", "))
+		message.content_subtype = self.content_subtype
+		return message
@@ -2,10 +2,11 @@ from cloudinary.models import CloudinaryField
 from django.db import models
 from .models import Inventory
 from .utils import ItemType
+from .images import CLOUDINARY_EAGER
 from django.utils.text import slugify
 
 class Display(models.Model):
-	image = CloudinaryField('image') 
+	image = CloudinaryField('image', eager=CLOUDINARY_EAGER, eager_async=True)
 	type = models.OneToOneField(ItemType, on_delete=models.CASCADE)
 
 	def __str__(self):
@@ -14,9 +15,16 @@ class Display(models.Model):
 
 class Item(models.Model): 
 	name = models.CharField(max_length=200)
-	image = CloudinaryField('image') 
+	image = CloudinaryField('image', eager=CLOUDINARY_EAGER, eager_async=True)
 	price = models.DecimalField(max_digits=10, decimal_places=2)
 	type = models.ForeignKey(ItemType, on_delete=models.CASCADE)
 
+	class Meta:
+		indexes = [
+			# Keyset pagination of the items page (see catalog.get_items)
+			models.Index(fields=['type', 'price', 'id'], name='item_type_price_id_idx'),
+			models.Index(fields=['type', 'name', 'id'], name='item_type_name_id_idx'),
+		]
+
 	def __str__(self):
 		return self.name
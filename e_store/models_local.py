@@ -17,6 +17,13 @@ class Item(models.Model):
 	price = models.DecimalField(max_digits=10, decimal_places=2)
 	type = models.ForeignKey(ItemType, on_delete=models.CASCADE)
 
+	class Meta:
+		indexes = [
+			# Keyset pagination of the items page (see catalog.get_items)
+			models.Index(fields=['type', 'price', 'id'], name='item_type_price_id_idx'),
+			models.Index(fields=['type', 'name', 'id'], name='item_type_name_id_idx'),
+		]
+
 	def __str__(self):
 		return self.name
 
@@ -0,0 +1,146 @@
+"""
+Whole page cache for the catalog pages (home, items), they render the same html for every visitor of a language.
+
+The page is rendered once with placeholders for the per visitor parts of base.html (csrf token of the language form,
+cart badge), the cached html is stored under the catalog version (see catalog.py) and the placeholders are replaced
+for each request, so a hit runs no template and no query for a visitor without a cart.
+
+conditional_page answers conditional requests of the catalog pages (If-None-Match / If-Modified-Since) with a 304
+from the catalog revisions before the view runs.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from django.utils.translation import get_language
+from django.views.decorators.http import condition
+
+from .catalog import CATALOG_TIMEOUT, CATALOG_REVISION_KEY, STOCK_REVISION_KEY, catalog_key, revisions
+
+CSRF_TOKEN_PLACEHOLDER = 'csrftokenplaceholder0page0cache'
+CART_ITEM_COUNT_PLACEHOLDER = 'cartitemcountplaceholder0page0cache'
+
+# Headers of a rendered page that aren't cached: set for the visitor it was rendered for,
+# or computed again for each response (the length changes with the placeholders)
+UNCACHED_HEADERS = {'set-cookie', 'content-length', 'etag', 'last-modified', 'expires', 'cache-control', 'date'}
+
+
+def is_cached_page(request):
+	"""True while a page is rendered for the cache, context processors must not put visitor data in it."""
+	return getattr(request, 'cached_page', False)
+
+
+def cache_page(params=()):
+	"""
+	Cache the GET responses of a catalog view per path (which holds the language prefix), language
+	and the GET params listed in params, other params are ignored so they can't fill the cache.
+	"""
+	def decorator(view):
+		@wraps(view)
+		def wrapper(request, *args, **kwargs):
+			# Flash messages are rendered in the page, they are shown once so the page is rendered normally
+			if request.method != 'GET' or len(messages.get_messages(request)):
+				return view(request, *args, **kwargs)
+
+			query = urlencode([(param, request.GET[param]) for param in params if request.GET.get(param)])
+			# Hashed, the path and params come from the visitor
+			url_hash = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+			key = catalog_key(f'page:{get_language()}:{url_hash}')
+
+			page = cache.get(key)
+			if page is None:
+				request.cached_page = True
+				try:
+					response = view(request, *args, **kwargs)
+				finally:
+					request.cached_page = False
+
+				# Redirects and errors aren't cached
+				if response.status_code != 200 or response.streaming:
+					return response
+
+				# Content-Type, Content-Language, Vary... are served with every hit, cookies stay with the visitor
+				headers = {
+					header: value for header, value in response.items() if header.lower() not in UNCACHED_HEADERS
+				}
+				page = {'content': response.content, 'headers': headers, 'status': response.status_code}
+				cache.set(key, page, CATALOG_TIMEOUT)
+
+			from .views import cart_get
+
+			content = page['content'].replace(
+				CSRF_TOKEN_PLACEHOLDER.encode(), get_token(request).encode()
+			).replace(
+				CART_ITEM_COUNT_PLACEHOLDER.encode(), str(cart_get(request).item_count).encode()
+			)
+			return HttpResponse(content, status=page['status'], headers=page['headers'])
+
+		return wrapper
+	return decorator
+
+
+def page_validators(request, stock):
+	"""
+	(etag, last modified) of a catalog page for this visitor, None when the page must be rendered:
+	not a GET or flash messages to show.
+	Computed once per request and kept on it, condition() asks for the etag and the last modified separately.
+	"""
+	if not hasattr(request, 'page_validators'):
+		request.page_validators = {}
+	if stock not in request.page_validators:
+		request.page_validators[stock] = compute_page_validators(request, stock)
+	return request.page_validators[stock]
+
+
+def compute_page_validators(request, stock):
+	if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+		return None
+
+	from .views import cart_get
+
+	# The page also shows the cart badge and the csrf token of the language form
+	cart = cart_get(request)
+	# Revisions live in the shared cache (see settings.CACHES), every worker answers with the same validators
+	timestamps = revisions(CATALOG_REVISION_KEY, STOCK_REVISION_KEY) if stock else revisions(CATALOG_REVISION_KEY)
+	if cart.pk:
+		timestamps.append(cart.updated_at.timestamp())
+
+	etag = hashlib.md5(':'.join(map(str, [
+		*timestamps, get_language(), cart.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+	])).encode()).hexdigest()
+
+	return etag, datetime.fromtimestamp(max(timestamps), tz=timezone.utc)
+
+
+def conditional_page(stock=False):
+	"""
+	ETag / Last-Modified for a catalog view, stock=True for pages showing the available stock.
+	The page holds visitor data, so it's private and revalidated on every visit.
+	"""
+	def etag(request, *args, **kwargs):
+		validators = page_validators(request, stock)
+		return validators and validators[0]
+
+	def last_modified(request, *args, **kwargs):
+		validators = page_validators(request, stock)
+		return validators and validators[1]
+
+	def decorator(view):
+		conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+		@wraps(view)
+		def wrapper(request, *args, **kwargs):
+			response = conditional_view(request, *args, **kwargs)
+			if request.method in ('GET', 'HEAD'):
+				patch_cache_control(response, private=True, no_cache=True)
+			return response
+
+		return wrapper
+	return decorator
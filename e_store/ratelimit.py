@@ -0,0 +1,104 @@
+"""
+Rate limits kept in the cache, so abuse is rejected before any database work.
+
+Sliding window approximated with two fixed windows: the count of the previous window is weighted by the part of it
+still inside the sliding window, count = previous * (1 - elapsed part of the current window) + current.
+Requests are counted per IP and per session, a request is limited when either is over the limit.
+Counters use cache.add() / cache.incr() in the shared cache (see settings.CACHES), atomic on memcached and redis.
+RATELIMIT_ENABLED=False turns the limits off for load tests.
+"""
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.utils.translation import gettext as _
+
+
+def get_user_ip(request):
+	"""
+	Client IP. X-Forwarded-For is sent by the client and can hold anything, only the entries appended by our own proxies
+	are trusted: behind TRUSTED_PROXY_COUNT proxies the client is that many entries from the right.
+	Without proxies (the default) the header is ignored and the IP of the connection is used.
+	"""
+	proxies = settings.TRUSTED_PROXY_COUNT
+	if proxies:
+		forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+		if len(forwarded) >= proxies:
+			return forwarded[-proxies]
+	return request.META.get('REMOTE_ADDR')
+
+
+class RateLimit:
+	"""At most limit requests per period seconds in scope, for each IP and each session."""
+
+	def __init__(self, scope, limit, period, message=None):
+		self.scope = scope
+		self.limit = limit
+		self.period = period
+		self.message = message
+
+	def keys(self, request):
+		identities = [f'ip:{get_user_ip(request)}']
+		# Don't create a session just for the limiter, visitors without one are limited by IP
+		if hasattr(request, 'session') and request.session.session_key:
+			identities.append(f'session:{request.session.session_key}')
+		return [f'ratelimit:{self.scope}:{identity}' for identity in identities]
+
+	def window(self):
+		now = time.time()
+		window = int(now // self.period)
+		elapsed = (now % self.period) / self.period
+		return window, elapsed
+
+	def count(self, key, window, elapsed):
+		counts = cache.get_many([f'{key}:{window}', f'{key}:{window - 1}'])
+		return counts.get(f'{key}:{window - 1}', 0) * (1 - elapsed) + counts.get(f'{key}:{window}', 0)
+
+	def exceeded(self, request):
+		"""True if the IP or the session already used up the limit, the request isn't counted."""
+		if not settings.RATELIMIT_ENABLED:
+			return False
+		window, elapsed = self.window()
+		return any(self.count(key, window, elapsed) >= self.limit for key in self.keys(request))
+
+	def hit(self, request):
+		"""Count the request, returns True if it went over the limit."""
+		if not settings.RATELIMIT_ENABLED:
+			return False
+		window, elapsed = self.window()
+		exceeded = False
+		for key in self.keys(request):
+			current_key = f'{key}:{window}'
+			# Kept for two periods: the next window still reads it as the previous one
+			cache.add(current_key, 0, self.period * 2)
+			try:
+				cache.incr(current_key)
+			except ValueError:  # Evicted between add() and incr()
+				cache.set(current_key, 1, self.period * 2)
+
+			if self.count(key, window, elapsed) > self.limit:
+				exceeded = True
+		return exceeded
+
+	def response(self, request):
+		message = self.message or _("Too many requests. Try again later.")
+		if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+			response = JsonResponse({'error': message}, status=429)
+		else:
+			response = HttpResponse(message, status=429)
+		response['Retry-After'] = self.period
+		return response
+
+	def __call__(self, view=None, methods=('POST',)):
+		"""Decorator counting the requests of methods, over the limit the view isn't run and a 429 is returned."""
+		def decorator(view):
+			@wraps(view)
+			def wrapper(request, *args, **kwargs):
+				if request.method in methods and self.hit(request):
+					return self.response(request)
+				return view(request, *args, **kwargs)
+			return wrapper
+
+		return decorator(view) if view else decorator
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from PIL import UnidentifiedImageError
+
+from .blacklist import invalidate_blacklist
+from .catalog import catalog_changed
+from .images import is_local, generate_derivatives, delete_derivatives
+from .models import BlackListedPhone, Display, Inventory, Item, Size
+from .utils import ItemType
+
+
+# Any change to the catalog models invalidates the catalog cache and the cached catalog pages,
+# bulk inventory changes bump the version themselves (see utils.set_inventories)
+for model in (ItemType, Size, Display, Item, Inventory):
+	post_save.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_save_{model.__name__}')
+	post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_delete_{model.__name__}')
+
+
+def build_image_derivatives(instance, **kwargs):
+	# Resized copies of a new upload, existing derivatives are skipped so other saves cost a few stats
+	if is_local(instance.image):
+		try:
+			generate_derivatives(instance.image.name)
+		except (OSError, UnidentifiedImageError):
+			# Missing or unreadable file, pages use the original until build_image_derivatives is run
+			pass
+
+
+def remove_image_derivatives(instance, **kwargs):
+	# The original file is kept and other rows can show it, their derivatives stay until the last one is deleted
+	if not is_local(instance.image):
+		return
+	name = instance.image.name
+	if not any(model.objects.filter(image=name).exists() for model in (Display, Item)):
+		transaction.on_commit(lambda: delete_derivatives(name))
+
+
+for model in (Display, Item):
+	post_save.connect(build_image_derivatives, sender=model, dispatch_uid=f'image_derivatives_save_{model.__name__}')
+	post_delete.connect(remove_image_derivatives, sender=model, dispatch_uid=f'image_derivatives_delete_{model.__name__}')
+
+
+# Admin edits of the blacklist reload the cached set (see blacklist.py)
+post_save.connect(invalidate_blacklist, sender=BlackListedPhone, dispatch_uid='blacklist_save')
+post_delete.connect(invalidate_blacklist, sender=BlackListedPhone, dispatch_uid='blacklist_delete')
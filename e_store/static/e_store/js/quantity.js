@@ -0,0 +1,98 @@
+// Progressive enhancement of the + - buttons, size buttons and quantity inputs of the item and cart pages:
+// forms with data-quantity-url are sent to the JSON endpoints instead of reloading the page.
+// Without javascript, or if the request fails, the form is submitted as before.
+(function () {
+  function update(form, data) {
+    var input = form.querySelector('input[name="quantity"]');
+    if (input && data.quantity !== undefined) {
+      input.value = data.quantity;
+      input.max = data.max_quantity;
+    }
+
+    form.querySelectorAll('button[name="adjust_quantity"]').forEach(function (button) {
+      button.disabled = button.value === 'increase' ? data.increase_disabled : data.decrease_disabled;
+    });
+
+    var error = form.querySelector('[data-role="quantity-error"]');
+    if (error) {
+      error.textContent = data.error || '';
+    }
+
+    if (data.size !== undefined) {
+      form.querySelector('input[data-role="size"]').value = data.size;
+      form.querySelectorAll('button[name="size"]').forEach(function (button) {
+        button.classList.toggle('btn-success', button.value === data.size);
+        button.classList.toggle('btn-outline-success', button.value !== data.size);
+      });
+    }
+
+    if (data.line_total !== undefined) {
+      form.querySelector('[data-role="line-total"]').textContent = data.line_total;
+      document.querySelectorAll('[data-role="cart-total"]').forEach(function (total) {
+        total.textContent = data.cart_total;
+      });
+      var badge = document.getElementById('cart-item-count');
+      if (badge) {
+        badge.textContent = data.cart_item_count;
+      }
+    }
+  }
+
+  function send(form, fields, fallback) {
+    var body = new FormData(form);
+    Object.keys(fields).forEach(function (name) {
+      body.set(name, fields[name]);
+    });
+
+    fetch(form.dataset.quantityUrl, {
+      method: 'POST',
+      body: body,
+      headers: {'X-Requested-With': 'XMLHttpRequest'},
+      credentials: 'same-origin',
+    }).then(function (response) {
+      var type = response.headers.get('Content-Type') || '';
+      if (type.indexOf('application/json') === -1) {
+        throw new Error('Not a JSON response');
+      }
+      return response.json();
+    }).then(function (data) {
+      update(form, data);
+    }).catch(fallback);
+  }
+
+  document.querySelectorAll('form[data-quantity-url]').forEach(function (form) {
+    form.addEventListener('click', function (event) {
+      var button = event.target.closest('button[name="adjust_quantity"], button[name="size"]');
+      if (!button || button.disabled) {
+        return;
+      }
+      event.preventDefault();
+
+      var fields = {};
+      fields[button.name] = button.value;
+      if (button.name === 'size') {
+        // New size: start again from 1
+        fields.quantity = 1;
+        fields.adjust_quantity = '';
+      } else {
+        fields.size = form.querySelector('input[data-role="size"]') ? form.querySelector('input[data-role="size"]').value : '';
+      }
+
+      send(form, fields, function () {
+        form.requestSubmit(button);
+      });
+    });
+
+    var input = form.querySelector('input[name="quantity"]');
+    if (input && form.dataset.quantityChange !== undefined) {
+      // The cart inputs submit the form on change, send them to the endpoint instead
+      input.onchange = null;
+      input.removeAttribute('onchange');
+      input.addEventListener('change', function () {
+        send(form, {adjust_quantity: ''}, function () {
+          form.submit();
+        });
+      });
+    }
+  });
+})();
@@ -0,0 +1,25 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from e_store.images import srcsets
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, sizes='200px', **attrs):
+	"""
+	<picture> with webp and jpeg srcsets of the image derivatives, the browser picks the smallest one that fits sizes.
+	Falls back to a plain <img> of the original when there are no derivatives.
+	Usage: {% responsive_image item.image sizes="200px" alt=item.name style="..." %}
+	"""
+	attributes = flatatt({'loading': 'lazy', **attrs})
+	sets = srcsets(image)
+	if not sets:
+		return format_html('<img src="{}"{}>', image.url, attributes)
+
+	return format_html(
+		'<picture><source type="image/webp" srcset="{}" sizes="{}"><img src="{}" srcset="{}" sizes="{}"{}></picture>',
+		sets['webp'], sizes, image.url, sets['jpeg'], sizes, attributes,
+	)
@@ -0,0 +1,41 @@
+from decimal import Decimal
+
+from e_store.models import Cart, CartItem, Display, Inventory, Item, Order, Size
+from e_store.utils import ItemType
+
+ORDER_DATA = {
+	'first_name': "Ali",
+	'last_name': "Benali",
+	'email': "ali@example.com",
+	'phone_number': "0555123456",
+	'address': "12 rue Didouche Mourad",
+	'city': "Algers",
+}
+
+
+def create_catalog(quantity=5, sizes=("S", "M", "L"), type_name="T-shirt"):
+	"""An item type with one inventory of quantity per size and one item, returns (item, {size name: inventory})."""
+	item_type = ItemType.objects.create(type=type_name)
+	inventories = {}
+	for name in sizes:
+		size, _ = Size.objects.get_or_create(name=name)
+		inventories[name] = Inventory.objects.create(type=item_type, size=size, quantity=quantity)
+	Display.objects.create(type=item_type, image=f"display/{item_type.slug}.jpg")
+	item = Item.objects.create(name=f"{type_name} item", image="item/item.jpg", price=Decimal("100.00"), type=item_type)
+	return item, inventories
+
+
+def create_cart(item, quantities):
+	"""Cart with a line of quantity for each {inventory: quantity}."""
+	cart = Cart.objects.create()
+	for inventory, quantity in quantities.items():
+		CartItem.objects.create(cart=cart, item=item, item_name=item.name, inventory=inventory, quantity=quantity)
+	return cart
+
+
+def create_order(cart, status=None, **data):
+	"""Pending order of cart, moved to status with change_status() if given."""
+	order = Order.objects.create(cart=cart, status="pending", total_price=cart.total_price(), **{**ORDER_DATA, **data})
+	if status:
+		order.change_status(status)
+	return order
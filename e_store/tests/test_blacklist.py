@@ -0,0 +1,67 @@
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from e_store.blacklist import BLACKLIST_KEY, blacklisted_phones, is_blacklisted, normalize_phone
+from e_store.forms import OrderForm
+from e_store.models import BlackListedPhone, Order
+
+from .helpers import ORDER_DATA, create_cart, create_catalog
+
+
+class BlacklistTests(TestCase):
+	"""Blacklisted numbers are matched in E.164 from a cached set."""
+
+	def setUp(self):
+		cache.clear()
+		BlackListedPhone.objects.create(phone_number="0555 12 34 56")
+
+	def test_normalize_phone(self):
+		self.assertEqual(normalize_phone("0555123456"), "+213555123456")
+		self.assertEqual(normalize_phone("+213 555 12 34 56"), "+213555123456")
+		self.assertEqual(normalize_phone(" not a number "), "not a number")
+		self.assertEqual(normalize_phone(""), "")
+
+	def test_stored_in_e164(self):
+		self.assertEqual(
+			BlackListedPhone.objects.values_list('phone_number', flat=True).get().as_e164, "+213555123456"
+		)
+
+	def test_matches_other_formats(self):
+		for phone in ("0555123456", "+213555123456", "00213555123456", "0555-12-34-56"):
+			self.assertTrue(is_blacklisted(phone), phone)
+		self.assertFalse(is_blacklisted("0666123456"))
+		self.assertFalse(is_blacklisted(""))
+
+	def test_lookups_are_cached(self):
+		blacklisted_phones()
+		with self.assertNumQueries(0):
+			self.assertTrue(is_blacklisted("0555123456"))
+			self.assertFalse(is_blacklisted("0666123456"))
+
+	def test_invalidated_on_save_and_delete(self):
+		self.assertFalse(is_blacklisted("0666123456"))
+		with self.captureOnCommitCallbacks(execute=True):
+			added = BlackListedPhone.objects.create(phone_number="+213666123456")
+		self.assertTrue(is_blacklisted("0666123456"))
+		with self.captureOnCommitCallbacks(execute=True):
+			added.delete()
+		self.assertFalse(is_blacklisted("0666123456"))
+
+	def test_lookup_before_commit(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			BlackListedPhone.objects.create(phone_number="+213666123456")
+			# A checkout of another connection caches the set before the admin commits
+			cache.set(BLACKLIST_KEY, frozenset(["+213555123456"]))
+		self.assertTrue(is_blacklisted("0666123456"))
+
+	def test_checkout_rejected(self):
+		item, inventories = create_catalog()
+		cart = create_cart(item, {inventories["S"]: 1})
+
+		form = OrderForm(cart, data={**ORDER_DATA, 'phone_number': "+213 555 12 34 56"})
+		self.assertFalse(form.is_valid())
+		self.assertIn('phone_number', form.errors)
+
+		with self.assertRaises(ValidationError):
+			Order.objects.create(cart=cart, status="pending", **ORDER_DATA)
@@ -0,0 +1,145 @@
+import os
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from e_store.models import Cart, CartItem, Display, Inventory, Item, Order, OrderItem, Size
+from e_store.utils import ItemType
+
+from .helpers import ORDER_DATA
+
+# Seeded volume
+ITEM_TYPES = 3
+ITEMS_PER_TYPE = 100
+CART_LINES = 40
+HISTORY_ORDERS = 60
+HISTORY_ORDER_LINES = 5
+
+# Time budgets are multiplied by TIME_BUDGET_SCALE (default 1), raise it on slow CI machines, 0 skips them
+TIME_BUDGET_SCALE = float(os.environ.get('TIME_BUDGET_SCALE', 1))
+
+
+class ViewBudgetTests(TestCase):
+	"""
+	Maximum number of queries and wall time of the shop views with a large catalog, a long cart and a long order history.
+	Query budgets don't depend on the data volume, a query per item or per cart line (N+1) goes over them.
+	Time budgets are loose (see TIME_BUDGET_SCALE), they catch pages becoming slow by an order of magnitude, not small regressions.
+	"""
+
+	@classmethod
+	def setUpTestData(cls):
+		sizes = [Size.objects.create(name=name) for name in ("S", "M", "L", "XL", "XXL")]
+		cls.item_types = [ItemType.objects.create(type=f"Type {i}") for i in range(ITEM_TYPES)]
+
+		# bulk_create skips the model save() checks, the data is valid
+		Inventory.objects.bulk_create([
+			Inventory(type=item_type, size=size, quantity=1000) for item_type in cls.item_types for size in sizes
+		])
+		Display.objects.bulk_create([
+			Display(type=item_type, image=f"display/{item_type.slug}.jpg") for item_type in cls.item_types
+		])
+		Item.objects.bulk_create([
+			Item(name=f"Item {i:03}", image=f"item/{i}.jpg", price=Decimal(100 + i), type=item_type)
+			for item_type in cls.item_types for i in range(ITEMS_PER_TYPE)
+		])
+		cls.item = Item.objects.filter(type=cls.item_types[0]).order_by('id').first()
+
+		inventories = list(Inventory.objects.select_related('type', 'size').order_by('id'))
+		items = list(Item.objects.order_by('id'))
+
+		cls.cart = Cart.objects.create()
+		CartItem.objects.bulk_create([
+			CartItem(cart=cls.cart, item=item, item_name=item.name, inventory=inventory, quantity=1)
+			for item, inventory in zip(
+				items[:CART_LINES],
+				[inventory for inventory in inventories if inventory.type_id == cls.item_types[0].id] * CART_LINES,
+			)
+		])
+		cls.cart.update_item_count()
+
+		cls.orders = Order.objects.bulk_create([
+			Order(cart=cls.cart, status="delivered", total_price=HISTORY_ORDER_LINES * 100, **ORDER_DATA)
+			for _ in range(HISTORY_ORDERS)
+		])
+		OrderItem.objects.bulk_create([
+			OrderItem(
+				order=order, item=item, item_name=item.name, inventory=inventories[i], quantity=1, total_price=item.price
+			)
+			for order in cls.orders for i, item in enumerate(items[:HISTORY_ORDER_LINES])
+		])
+
+	def setUp(self):
+		# Cold caches: catalog, cached pages and rate limit counters
+		cache.clear()
+		session = self.client.session
+		session['session_cart_id'] = self.cart.id
+		session.save()
+
+	def assertBudget(self, max_queries, max_seconds, method, url, data=None, status=200):
+		with CaptureQueriesContext(connection) as queries:
+			start = time.perf_counter()
+			response = getattr(self.client, method)(url, data)
+			elapsed = time.perf_counter() - start
+
+		self.assertEqual(response.status_code, status)
+		self.assertLessEqual(
+			len(queries), max_queries,
+			f"{method.upper()} {url} ran {len(queries)} queries:\n" + "\n".join(q['sql'] for q in queries.captured_queries)
+		)
+		if TIME_BUDGET_SCALE:
+			self.assertLessEqual(elapsed, max_seconds * TIME_BUDGET_SCALE, f"{method.upper()} {url} took {elapsed:.3f}s")
+		return response
+
+	def test_home(self):
+		self.assertBudget(2, 2, 'get', reverse('e_store:home'))
+		# Cached page, only the cart badge
+		self.assertBudget(1, 1, 'get', reverse('e_store:home'))
+
+	def test_items(self):
+		url = reverse('e_store:items', args=[self.item_types[0].slug])
+		for sort in ('name', '-name', 'price', '-price'):
+			self.assertBudget(3, 2, 'get', url, {'sort': sort})
+
+		response = self.client.get(url)
+		self.assertBudget(3, 2, 'get', url, {'after': response.context['next_cursor']})
+		self.assertBudget(1, 1, 'get', url)
+
+	def test_item(self):
+		url = reverse('e_store:item', args=[self.item.id])
+		self.assertBudget(3, 2, 'get', url)
+		# Size and + - buttons
+		self.assertBudget(2, 2, 'post', url, {'size': ['', 'M'], 'quantity': 1})
+		self.assertBudget(2, 2, 'post', url, {'size': 'M', 'quantity': 1, 'adjust_quantity': 'increase'})
+		self.assertBudget(16, 2, 'post', url, {'size': 'M', 'quantity': 1, 'add_to_cart': ''}, status=302)
+
+	def test_cart(self):
+		self.assertBudget(4, 2, 'get', reverse('e_store:cart'))
+
+	def test_create_order(self):
+		url = reverse('e_store:create_order')
+		self.assertBudget(4, 2, 'get', url)
+		self.assertBudget(16, 2, 'post', url, ORDER_DATA, status=302)
+
+	def test_order(self):
+		# Confirmed order: order items
+		self.assertBudget(4, 2, 'get', reverse('e_store:order', args=[self.orders[0].id]))
+
+	def test_pending_order(self):
+		self.client.post(reverse('e_store:create_order'), ORDER_DATA)
+		order = Order.objects.get(cart=self.cart, status="pending")
+		url = reverse('e_store:order', args=[order.id])
+
+		# Pending order: cart items
+		self.assertBudget(5, 2, 'get', url)
+		self.assertBudget(26, 2, 'post', url, {'confirm_order': order.id}, status=302)
+		order.refresh_from_db()
+		self.assertEqual(order.status, "confirmed")
+		self.assertEqual(order.orderitem_set.count(), CART_LINES)
+
+	def test_order_history(self):
+		self.assertBudget(2, 2, 'get', reverse('e_store:order_history'))
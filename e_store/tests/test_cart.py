@@ -0,0 +1,54 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.urls import reverse
+
+from e_store.models import CartItem
+
+from .helpers import create_cart, create_catalog
+
+
+class CartItemQuantityTests(TestCase):
+	"""The JSON quantity endpoint of the cart page answers every invalid quantity with a 400 and the saved quantity."""
+
+	def setUp(self):
+		cache.clear()
+		item, inventories = create_catalog(quantity=5)
+		self.cart = create_cart(item, {inventories["S"]: 2})
+		self.cart_item = self.cart.cartitem_set.get()
+		self.url = reverse('e_store:cart_item_quantity', args=[self.cart_item.id])
+
+		session = self.client.session
+		session['session_cart_id'] = self.cart.id
+		session.save()
+
+	def post(self, **data):
+		response = self.client.post(self.url, data)
+		return response.status_code, response.json()
+
+	def test_quantity_saved(self):
+		status, data = self.post(quantity=4)
+		self.assertEqual(status, 200)
+		self.assertEqual((data['quantity'], data['error']), (4, None))
+
+	def test_field_error(self):
+		status, data = self.post(quantity="two")
+		self.assertEqual(status, 400)
+		self.assertEqual((data['quantity'], data['error']), (2, "Please enter a valid whole number."))
+
+	def test_stock_error(self):
+		status, data = self.post(quantity=9)
+		self.assertEqual(status, 400)
+		self.assertEqual((data['quantity'], data['error']), (2, "Stock unavailable, select a lower amount."))
+
+	def test_non_field_error(self):
+		# Errors of CartItem.clean() aren't attached to the quantity field
+		with mock.patch.object(CartItem, 'clean', side_effect=ValidationError("Inventory not found for this item.")):
+			status, data = self.post(quantity=3)
+
+		self.assertEqual(status, 400)
+		self.assertEqual((data['quantity'], data['error']), (2, "Inventory not found for this item."))
+		self.cart_item.refresh_from_db()
+		self.assertEqual(self.cart_item.quantity, 2)
@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from django.core import signing
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from e_store.catalog import ITEM_SORTS, ITEMS_PAGE_SIZE, get_items, items_cursor
+from e_store.models import Item
+
+from .helpers import create_catalog
+
+
+class ItemsPaginationTests(TestCase):
+	"""Keyset pagination of the items page with signed ?after= cursors."""
+
+	def setUp(self):
+		cache.clear()
+		item, _ = create_catalog()
+		self.item_type = item.type
+		# Repeated prices and names, the id breaks the ties
+		Item.objects.bulk_create([
+			Item(name=f"Item {i % 7}", image="item/item.jpg", price=Decimal(100 + i % 5), type=self.item_type)
+			for i in range(ITEMS_PAGE_SIZE * 2 + 5)
+		])
+		self.url = reverse('e_store:items', args=[self.item_type.slug])
+
+	def test_pages_cover_every_item_once(self):
+		expected = sorted(Item.objects.filter(type=self.item_type).values_list('id', flat=True))
+		for sort in ITEM_SORTS:
+			ids = []
+			items, cursor = get_items(self.item_type, sort)
+			ids += [item.id for item in items]
+			while cursor:
+				items, cursor = get_items(self.item_type, sort, cursor)
+				ids += [item.id for item in items]
+			self.assertEqual(sorted(ids), expected, sort)
+			self.assertEqual(len(ids), len(set(ids)), sort)
+
+	def test_cursor_of_another_sort_is_ignored(self):
+		first_page = self.client.get(self.url, {'sort': 'price'}).context['items']
+		name_cursor = self.client.get(self.url, {'sort': 'name'}).context['next_cursor']
+
+		response = self.client.get(self.url, {'sort': 'price', 'after': name_cursor})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(list(response.context['items']), list(first_page))
+		self.assertIsNone(response.context['cursor'])
+
+	def test_invalid_cursor_values_are_ignored(self):
+		for payload in (["Zed shirt", 1], ["100", "x"], ["100"], "100"):
+			cursor = signing.dumps(payload, salt='items-cursor:price')
+			response = self.client.get(self.url, {'sort': 'price', 'after': cursor})
+			self.assertEqual(response.status_code, 200, payload)
+			self.assertIsNone(response.context['cursor'], payload)
+
+		response = self.client.get(self.url, {'sort': 'price', 'after': 'tampered'})
+		self.assertEqual(response.status_code, 200)
+
+	def test_cursor_round_trip(self):
+		item = Item.objects.filter(type=self.item_type).first()
+		items, _ = get_items(self.item_type, '-price', items_cursor(item, '-price'))
+		self.assertTrue(all((i.price, i.id) < (item.price, item.id) for i in items))
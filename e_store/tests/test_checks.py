@@ -0,0 +1,22 @@
+from django.test import SimpleTestCase, override_settings
+
+from e_store.checks import check_shared_cache
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DATABASE = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'e_store_cache'}}
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+	"""A per process cache is refused in production."""
+
+	@override_settings(DEBUG=False, CACHES=LOCMEM)
+	def test_locmem_in_production(self):
+		self.assertEqual([error.id for error in check_shared_cache(None)], ['e_store.E001'])
+
+	@override_settings(DEBUG=True, CACHES=LOCMEM)
+	def test_locmem_in_development(self):
+		self.assertEqual(check_shared_cache(None), [])
+
+	@override_settings(DEBUG=False, CACHES=DATABASE)
+	def test_shared_cache(self):
+		self.assertEqual(check_shared_cache(None), [])
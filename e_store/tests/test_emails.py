@@ -0,0 +1,90 @@
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from e_store.models import OutgoingEmail
+
+from .helpers import create_cart, create_catalog, create_order
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+	"""Status changes queue emails in the outbox, send_emails delivers them and retries failures with a backoff."""
+
+	def setUp(self):
+		item, inventories = create_catalog()
+		self.order = create_order(create_cart(item, {inventories["S"]: 1}))
+
+	def send(self, *args):
+		call_command('send_emails', '--backoff', '60', '--max-attempts', '3', *args, stdout=StringIO(), stderr=StringIO())
+
+	def test_status_change_queues_one_email(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			self.order.change_status("confirmed")
+
+		email = OutgoingEmail.objects.get(order=self.order)
+		self.assertEqual(email.to, self.order.email)
+		self.assertIsNone(email.sent_at)
+		# Sent by the worker, not in the request
+		self.assertEqual(len(mail.outbox), 0)
+
+	def test_send(self):
+		self.order.change_status("confirmed")
+		self.send()
+
+		self.assertEqual(len(mail.outbox), 1)
+		self.assertEqual(mail.outbox[0].to, [self.order.email])
+		email = OutgoingEmail.objects.get(order=self.order)
+		self.assertIsNotNone(email.sent_at)
+
+		# Sent once
+		self.send()
+		self.assertEqual(len(mail.outbox), 1)
+
+	def test_failed_send_is_retried_with_backoff(self):
+		self.order.change_status("confirmed")
+		with mock.patch.object(EmailBackend, 'send_messages', side_effect=SMTPException("unavailable")):
+			self.send()
+
+		email = OutgoingEmail.objects.get(order=self.order)
+		self.assertIsNone(email.sent_at)
+		self.assertEqual(email.attempts, 1)
+		self.assertIn("unavailable", email.last_error)
+		self.assertAlmostEqual(email.send_after, timezone.now() + timedelta(seconds=60), delta=timedelta(seconds=10))
+
+		# Not retried before send_after
+		self.send()
+		self.assertEqual(len(mail.outbox), 0)
+
+		OutgoingEmail.objects.update(send_after=timezone.now())
+		self.send()
+		self.assertEqual(len(mail.outbox), 1)
+		email.refresh_from_db()
+		self.assertIsNotNone(email.sent_at)
+
+	def test_backoff_doubles_and_gives_up(self):
+		self.order.change_status("confirmed")
+		with mock.patch.object(EmailBackend, 'send_messages', side_effect=SMTPException("unavailable")):
+			delays = []
+			for _ in range(3):
+				OutgoingEmail.objects.update(send_after=timezone.now())
+				self.send()
+				email = OutgoingEmail.objects.get(order=self.order)
+				delays.append(round((email.send_after - timezone.now()).total_seconds() / 60))
+
+		self.assertEqual(delays, [1, 2, 4])
+		self.assertEqual(email.attempts, 3)
+
+		# Given up after --max-attempts, even once the server is back
+		OutgoingEmail.objects.update(send_after=timezone.now())
+		self.send()
+		self.assertEqual(len(mail.outbox), 0)
+		email.refresh_from_db()
+		self.assertIsNone(email.sent_at)
@@ -0,0 +1,116 @@
+from io import StringIO
+from unittest import mock
+
+import cloudinary.uploader
+from cloudinary import CloudinaryResource
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import isolate_apps
+
+from e_store import images
+from e_store.images import CLOUDINARY_EAGER, DERIVATIVE_WIDTHS, cloudinary_urls, srcsets
+from e_store.management.commands.build_image_derivatives import Command as BuildImageDerivatives
+from e_store.models import Item
+
+from .helpers import create_catalog
+
+UPLOAD_RESULT = {'public_id': "item/shirt", 'version': 123, 'type': "upload", 'resource_type': "image", 'format': "jpg"}
+
+
+class CloudinaryImageTests(SimpleTestCase):
+	"""Cloudinary generates the derivatives at upload (eager), the backfill asks for the older images."""
+
+	def setUp(self):
+		images.build_cloudinary_urls.cache_clear()
+		self.image = CloudinaryResource("item/shirt", version=123, format="jpg", type="upload", resource_type="image")
+
+	def test_upload_requests_eager_transformations(self):
+		# The tests run with local storage, load the Cloudinary models in their own registry
+		with isolate_apps('e_store'):
+			from e_store import models_cloudinary
+
+		for model in (models_cloudinary.Item, models_cloudinary.Display):
+			field = model._meta.get_field('image')
+			instance = model(image=SimpleUploadedFile("shirt.jpg", b"image"))
+			with mock.patch.object(cloudinary.uploader, 'upload', return_value=UPLOAD_RESULT) as upload:
+				field.pre_save(instance, True)
+
+			upload.assert_called_once()
+			self.assertEqual(upload.call_args.kwargs['eager'], CLOUDINARY_EAGER)
+			self.assertTrue(upload.call_args.kwargs['eager_async'])
+
+	def test_backfill_calls_explicit(self):
+		command = BuildImageDerivatives(stdout=StringIO(), stderr=StringIO())
+		with mock.patch.object(
+			cloudinary.uploader, 'explicit', side_effect=[None, Exception("not found")]
+		) as explicit:
+			command.build_cloudinary({"item/shirt", "display/t-shirt"})
+
+		self.assertEqual([call.args for call in explicit.call_args_list], [("display/t-shirt",), ("item/shirt",)])
+		for call in explicit.call_args_list:
+			self.assertEqual(call.kwargs, {'type': "upload", 'eager': CLOUDINARY_EAGER, 'eager_async': True})
+		self.assertIn("2 Cloudinary images, 1 failed.", command.stdout.getvalue())
+
+	def test_urls_match_eager_and_are_memoized(self):
+		urls = cloudinary_urls(self.image)
+		# Same transformation as the eager one, the format is the extension
+		self.assertIn("/c_limit,q_auto,w_200/v123/item/shirt.webp", urls[200, 'webp'])
+		self.assertIn("/c_limit,q_auto,w_800/v123/item/shirt.jpg", urls[800, 'jpeg'])
+
+		with mock.patch.object(CloudinaryResource, 'build_url') as build_url:
+			self.assertEqual(cloudinary_urls(self.image), urls)
+			srcsets(self.image)
+		build_url.assert_not_called()
+
+		# A new upload has a new version
+		self.image.version = 124
+		self.assertIn("v124/item/shirt", cloudinary_urls(self.image)[DERIVATIVE_WIDTHS[0], 'jpeg'])
+
+
+class LocalDerivativesTests(SimpleTestCase):
+	"""Found derivatives are remembered, the storage isn't checked for each image on every render."""
+
+	def setUp(self):
+		images.DERIVATIVES_FOUND.clear()
+		self.image = mock.Mock(spec=['name'])
+		self.image.name = "item/shirt.jpg"
+
+	def test_found_once(self):
+		with mock.patch.object(default_storage, 'exists', return_value=True) as exists:
+			self.assertTrue(images.has_derivatives(self.image))
+			self.assertTrue(images.has_derivatives(self.image))
+		self.assertEqual(exists.call_count, 1)
+
+	def test_missing_checked_again(self):
+		with mock.patch.object(default_storage, 'exists', side_effect=[False, True]) as exists:
+			self.assertFalse(images.has_derivatives(self.image))
+			# Built in the meantime
+			self.assertTrue(images.has_derivatives(self.image))
+		self.assertEqual(exists.call_count, 2)
+
+	def test_forgotten_on_delete(self):
+		with mock.patch.object(default_storage, 'exists', return_value=True):
+			images.has_derivatives(self.image)
+		with mock.patch.object(default_storage, 'exists', return_value=False), \
+				mock.patch.object(default_storage, 'delete'):
+			images.delete_derivatives(self.image.name)
+			self.assertFalse(images.has_derivatives(self.image))
+
+
+class DeleteDerivativesTests(TestCase):
+	"""Derivatives of an image are deleted with the last row showing it, once the delete is committed."""
+
+	def setUp(self):
+		self.item, _ = create_catalog()
+		self.copy = Item.objects.create(name="Copy", image=self.item.image.name, price=self.item.price, type=self.item.type)
+
+	def test_kept_while_referenced(self):
+		with mock.patch('e_store.signals.delete_derivatives') as delete_derivatives:
+			with self.captureOnCommitCallbacks(execute=True):
+				self.copy.delete()
+			delete_derivatives.assert_not_called()
+
+			with self.captureOnCommitCallbacks(execute=True):
+				self.item.delete()
+			delete_derivatives.assert_called_once_with("item/item.jpg")
@@ -0,0 +1,154 @@
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from e_store.models import Inventory
+from e_store.utils import decrease_inventories, release_inventories, reserve_inventories, set_inventories
+
+from .helpers import create_cart, create_catalog, create_order
+
+
+class ReservationTests(TestCase):
+	"""Stock is reserved by confirmed orders with conditional UPDATEs and can't be oversold."""
+
+	def setUp(self):
+		self.item, self.inventories = create_catalog(quantity=5)
+		self.small, self.medium = self.inventories["S"], self.inventories["M"]
+
+	def test_reserve_within_stock(self):
+		self.assertEqual(reserve_inventories({self.small.id: 3, self.medium.id: 5}), [])
+		self.small.refresh_from_db()
+		self.medium.refresh_from_db()
+		self.assertEqual((self.small.quantity, self.small.reserved_quantity), (5, 3))
+		self.assertEqual((self.medium.quantity, self.medium.reserved_quantity), (5, 5))
+
+	def test_reserve_is_all_or_nothing(self):
+		self.assertEqual(reserve_inventories({self.small.id: 2, self.medium.id: 6}), [self.medium.id])
+		self.small.refresh_from_db()
+		self.medium.refresh_from_db()
+		self.assertEqual(self.small.reserved_quantity, 0)
+		self.assertEqual(self.medium.reserved_quantity, 0)
+
+	def test_release_and_decrease(self):
+		reserve_inventories({self.small.id: 4})
+		release_inventories({self.small.id: 1})
+		self.small.refresh_from_db()
+		self.assertEqual(self.small.reserved_quantity, 3)
+
+		self.assertEqual(decrease_inventories({self.small.id: 3}), [])
+		self.small.refresh_from_db()
+		self.assertEqual((self.small.quantity, self.small.reserved_quantity), (2, 0))
+
+		# Never below 0
+		release_inventories({self.small.id: 10})
+		self.small.refresh_from_db()
+		self.assertEqual(self.small.reserved_quantity, 0)
+
+	def test_last_units_confirmed_once(self):
+		# Both carts were filled while the 5 units were available
+		first = create_order(create_cart(self.item, {self.small: 4}))
+		second = create_order(create_cart(self.item, {self.small: 3}))
+
+		first.change_status("confirmed")
+		with self.assertRaises(ValidationError):
+			second.change_status("confirmed")
+
+		self.small.refresh_from_db()
+		self.assertEqual(self.small.reserved_quantity, 4)
+		second.refresh_from_db()
+		self.assertEqual(second.status, "pending")
+		self.assertFalse(second.orderitem_set.exists())
+
+	def test_cancelled_order_releases_stock(self):
+		order = create_order(create_cart(self.item, {self.small: 2, self.medium: 1}), status="confirmed")
+		order.change_status("cancelled")
+
+		self.small.refresh_from_db()
+		self.medium.refresh_from_db()
+		self.assertEqual(self.small.reserved_quantity, 0)
+		self.assertEqual(self.medium.reserved_quantity, 0)
+
+
+class InventorySaveTests(TestCase):
+	"""Saving an inventory (admin) never writes reserved_quantity."""
+
+	def setUp(self):
+		self.item, self.inventories = create_catalog(quantity=5)
+		self.small = self.inventories["S"]
+
+	def test_reservation_made_after_loading_is_kept(self):
+		loaded = Inventory.objects.get(id=self.small.id)
+		# A checkout reserves while the admin form is open
+		reserve_inventories({self.small.id: 2})
+
+		loaded.quantity = 8
+		loaded.save()
+
+		self.small.refresh_from_db()
+		self.assertEqual((self.small.quantity, self.small.reserved_quantity), (8, 2))
+		self.assertEqual(loaded.reserved_quantity, 2)
+
+	def test_decrease_clamps_cart_items(self):
+		cart = create_cart(self.item, {self.small: 4})
+		self.small.quantity = 2
+		self.small.save()
+
+		self.assertEqual(cart.cartitem_set.get().quantity, 2)
+
+	def test_decrease_updates_pending_order_total(self):
+		cart = create_cart(self.item, {self.small: 4})
+		order = create_order(cart)
+		self.assertEqual(order.total_price, 400)
+
+		set_inventories({(self.small.type_id, self.small.size_id): 2})
+
+		cart.refresh_from_db()
+		order.refresh_from_db()
+		self.assertEqual(cart.item_count, 2)
+		self.assertEqual(order.total_price, 200)
+
+
+class SetInventoriesTests(TestCase):
+	"""Restocks (admin matrix, restock command) can't drop the stock below the reserved quantity."""
+
+	def setUp(self):
+		self.item, self.inventories = create_catalog(quantity=5)
+		self.small, self.medium = self.inventories["S"], self.inventories["M"]
+		reserve_inventories({self.small.id: 3})
+
+	def key(self, inventory):
+		return (inventory.type_id, inventory.size_id)
+
+	def test_below_reserved_is_rejected(self):
+		with self.assertRaisesMessage(ValidationError, "below the 3 reserved"):
+			set_inventories({self.key(self.small): 2, self.key(self.medium): 9})
+
+		# Nothing saved
+		self.small.refresh_from_db()
+		self.medium.refresh_from_db()
+		self.assertEqual((self.small.quantity, self.medium.quantity), (5, 5))
+
+	def test_add_below_reserved_is_rejected(self):
+		with self.assertRaises(ValidationError):
+			set_inventories({self.key(self.small): -3}, add=True)
+
+	def test_down_to_reserved(self):
+		self.assertEqual(set_inventories({self.key(self.small): 3}), (0, 1))
+		self.small.refresh_from_db()
+		self.assertEqual((self.small.quantity, self.small.reserved_quantity), (3, 3))
+
+	def test_clean(self):
+		self.small.refresh_from_db()
+		self.small.quantity = 2
+		with self.assertRaises(ValidationError):
+			self.small.full_clean()
+
+	def test_benchmark_restock_keeps_reserved(self):
+		# Restocks before reaching the server, nothing listens on port 9
+		with self.assertRaisesMessage(CommandError, "Server not reachable"):
+			call_command('benchmark_journey', '--restock', '10', '--url', 'http://127.0.0.1:9', '--timeout', '1')
+
+		self.small.refresh_from_db()
+		self.medium.refresh_from_db()
+		self.assertEqual((self.small.quantity, self.small.reserved_quantity), (13, 3))
+		self.assertEqual(self.medium.quantity, 10)
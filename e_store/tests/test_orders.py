@@ -0,0 +1,98 @@
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from e_store.models import Order, OutgoingEmail
+
+from .helpers import create_cart, create_catalog, create_order
+
+
+class ChangeStatusTests(TestCase):
+	"""Order.change_status() writes the status with a conditional UPDATE, a stale instance can't apply it twice."""
+
+	def setUp(self):
+		self.item, self.inventories = create_catalog(quantity=5)
+		self.small = self.inventories["S"]
+		self.order = create_order(create_cart(self.item, {self.small: 2}), status="confirmed")
+
+	def test_invalid_transition(self):
+		with self.assertRaises(ValidationError):
+			self.order.change_status("delivered")
+		self.assertEqual(self.order.status, "confirmed")
+
+	def test_stale_instance_is_rejected(self):
+		# Another order holds 1 unit, a second release would take it back
+		create_order(create_cart(self.item, {self.small: 1}), status="confirmed")
+
+		# Two requests loaded the confirmed order, both cancel it
+		first = Order.objects.get(id=self.order.id)
+		second = Order.objects.get(id=self.order.id)
+		first.change_status("cancelled")
+		with self.assertRaisesMessage(ValidationError, "updated in the meantime"):
+			second.change_status("cancelled")
+
+		self.assertEqual(second.status, "confirmed")
+		self.small.refresh_from_db()
+		# Released once, not twice
+		self.assertEqual(self.small.reserved_quantity, 1)
+		# Confirmation and one cancellation email
+		self.assertEqual(OutgoingEmail.objects.filter(order=self.order).count(), 2)
+
+	def test_stale_printing_decreases_once(self):
+		first = Order.objects.get(id=self.order.id)
+		second = Order.objects.get(id=self.order.id)
+		first.change_status("printing")
+		with self.assertRaises(ValidationError):
+			second.change_status("printing")
+
+		self.small.refresh_from_db()
+		self.assertEqual((self.small.quantity, self.small.reserved_quantity), (3, 0))
+
+
+class BulkChangeStatusTests(TestCase):
+	"""Admin actions move many orders at once, stock is decreased once per inventory."""
+
+	def setUp(self):
+		self.item, self.inventories = create_catalog(quantity=10)
+		self.small, self.medium = self.inventories["S"], self.inventories["M"]
+		self.confirmed = [
+			create_order(create_cart(self.item, {self.small: 2, self.medium: 1}), status="confirmed") for _ in range(3)
+		]
+		self.pending = create_order(create_cart(self.item, {self.small: 1}))
+
+	def ids(self):
+		return [order.id for order in self.confirmed] + [self.pending.id]
+
+	def test_printing_skips_other_statuses(self):
+		changed = Order.bulk_change_status(self.ids(), "printing")
+
+		self.assertCountEqual(changed, [order.id for order in self.confirmed])
+		self.pending.refresh_from_db()
+		self.assertEqual(self.pending.status, "pending")
+		self.small.refresh_from_db()
+		self.medium.refresh_from_db()
+		self.assertEqual((self.small.quantity, self.small.reserved_quantity), (4, 0))
+		self.assertEqual((self.medium.quantity, self.medium.reserved_quantity), (7, 0))
+
+	def test_repeated_action_changes_nothing(self):
+		Order.bulk_change_status(self.ids(), "printing")
+		# Second click, or a concurrent admin: the orders are no longer confirmed
+		self.assertEqual(Order.bulk_change_status(self.ids(), "printing"), [])
+		self.small.refresh_from_db()
+		self.assertEqual(self.small.quantity, 4)
+
+	def test_short_inventory_changes_nothing(self):
+		# Stock lowered below the reservations outside the app
+		type(self.small).objects.filter(id=self.small.id).update(quantity=3)
+
+		with self.assertRaisesMessage(ValidationError, "Not enough stock"):
+			Order.bulk_change_status(self.ids(), "printing")
+
+		self.assertEqual(Order.objects.filter(status="confirmed").count(), 3)
+		self.medium.refresh_from_db()
+		self.assertEqual(self.medium.quantity, 10)
+
+	def test_queues_one_email_per_order(self):
+		Order.bulk_change_status(self.ids(), "printing")
+		before = OutgoingEmail.objects.count()
+		Order.bulk_change_status(self.ids(), "shipped")
+		self.assertEqual(OutgoingEmail.objects.count() - before, 3)
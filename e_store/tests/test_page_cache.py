@@ -0,0 +1,79 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from e_store import page_cache
+from e_store.models import Cart
+
+from .helpers import create_catalog
+
+
+class ConditionalPageTests(TestCase):
+	"""Catalog pages answer conditional requests with a 304 from validators computed once per request."""
+
+	def setUp(self):
+		cache.clear()
+		self.item, _ = create_catalog()
+		self.url = reverse('e_store:item', args=[self.item.id])
+
+	def test_validators_computed_once(self):
+		with mock.patch.object(
+			page_cache, 'compute_page_validators', wraps=page_cache.compute_page_validators
+		) as compute:
+			response = self.client.get(self.url)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(compute.call_count, 1)
+		self.assertTrue(response.has_header('ETag'))
+		self.assertTrue(response.has_header('Last-Modified'))
+
+	def test_not_modified(self):
+		# The first visit sets the csrf cookie, which is part of the etag
+		self.client.get(self.url)
+		etag = self.client.get(self.url)['ETag']
+		self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+		# A catalog change makes the page outdated, once committed
+		with self.captureOnCommitCallbacks(execute=True):
+			self.item.save()
+			self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+		self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CachePageTests(TestCase):
+	"""Cached pages are served with the headers of the rendered page, without its cookies."""
+
+	def setUp(self):
+		cache.clear()
+		self.calls = 0
+
+		@page_cache.cache_page()
+		def view(request):
+			self.calls += 1
+			response = HttpResponse(b"<p>page</p>", content_type="text/html; charset=utf-8")
+			response['Content-Language'] = "fr"
+			response['Vary'] = "Accept-Language"
+			response.set_cookie('visitor', 'first')
+			return response
+
+		self.view = view
+
+	def get(self):
+		request = RequestFactory().get('/page/')
+		request.session = {}
+		request.cart = Cart()
+		return self.view(request)
+
+	def test_hit_keeps_headers(self):
+		self.get()
+		response = self.get()
+
+		self.assertEqual(self.calls, 1)
+		self.assertEqual(response.content, b"<p>page</p>")
+		self.assertEqual(response['Content-Type'], "text/html; charset=utf-8")
+		self.assertEqual(response['Content-Language'], "fr")
+		self.assertEqual(response['Vary'], "Accept-Language")
+		self.assertNotIn('visitor', response.cookies)
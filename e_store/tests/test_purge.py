@@ -0,0 +1,66 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from e_store.models import Cart, CartItem, Order
+
+from .helpers import create_cart, create_catalog, create_order
+
+
+class PurgeExpiredTests(TestCase):
+	"""purge_expired deletes the stale carts and expired sessions in batches, carts of an order are kept."""
+
+	def setUp(self):
+		item, inventories = create_catalog(quantity=100)
+		old = timezone.now() - timedelta(days=40)
+
+		self.expired = [create_cart(item, {inventories["S"]: 1, inventories["M"]: 1}) for _ in range(5)]
+		self.recent = create_cart(item, {inventories["S"]: 1})
+		self.ordered = create_cart(item, {inventories["S"]: 1})
+		self.order = create_order(self.ordered)
+		Cart.objects.exclude(id=self.recent.id).update(updated_at=old)
+
+		for _ in range(3):
+			SessionStore().create()
+		Session.objects.update(expire_date=old)
+		self.live_session = SessionStore()
+		self.live_session.create()
+
+	def purge(self, *args):
+		out = StringIO()
+		call_command('purge_expired', '--batch-size', '2', '--sleep', '0', *args, stdout=out)
+		return out.getvalue()
+
+	def test_dry_run_deletes_nothing(self):
+		out = self.purge('--dry-run')
+
+		self.assertIn("Would delete 5 carts and 3 sessions.", out)
+		self.assertEqual(Cart.objects.count(), 7)
+		self.assertEqual(Session.objects.count(), 4)
+
+	def test_purge(self):
+		out = self.purge()
+
+		self.assertIn("Deleted 5 carts and 3 sessions.", out)
+		self.assertCountEqual(Cart.objects.values_list('id', flat=True), [self.recent.id, self.ordered.id])
+		self.assertFalse(CartItem.objects.filter(cart__in=[cart.id for cart in self.expired]).exists())
+		self.assertTrue(Order.objects.filter(id=self.order.id).exists())
+		self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [self.live_session.session_key])
+
+	def test_batches(self):
+		out = self.purge()
+
+		# 5 carts in batches of 2, 3 sessions in batches of 2
+		self.assertEqual([line for line in out.splitlines() if line.endswith("carts deleted...")],
+			["2 carts deleted...", "4 carts deleted...", "5 carts deleted..."])
+		self.assertEqual([line for line in out.splitlines() if line.endswith("sessions deleted...")],
+			["2 sessions deleted...", "3 sessions deleted..."])
+
+	def test_days(self):
+		self.purge('--days', '60')
+		self.assertEqual(Cart.objects.count(), 7)
@@ -0,0 +1,104 @@
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from e_store.ratelimit import RateLimit, get_user_ip
+from e_store.views import ORDER_RATE_LIMIT
+
+
+class GetUserIpTests(TestCase):
+
+	def request(self, forwarded=None):
+		extra = {'HTTP_X_FORWARDED_FOR': forwarded} if forwarded else {}
+		return RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', **extra)
+
+	@override_settings(TRUSTED_PROXY_COUNT=0)
+	def test_header_ignored_without_proxy(self):
+		self.assertEqual(get_user_ip(self.request('1.2.3.4')), '10.0.0.1')
+
+	@override_settings(TRUSTED_PROXY_COUNT=1)
+	def test_entry_appended_by_the_proxy(self):
+		# The client sent "6.6.6.6", the proxy appended the address it saw
+		self.assertEqual(get_user_ip(self.request('6.6.6.6, 1.2.3.4')), '1.2.3.4')
+		self.assertEqual(get_user_ip(self.request('1.2.3.4')), '1.2.3.4')
+
+	@override_settings(TRUSTED_PROXY_COUNT=2)
+	def test_two_proxies(self):
+		self.assertEqual(get_user_ip(self.request('6.6.6.6, 1.2.3.4, 10.1.1.1')), '1.2.3.4')
+		# Shorter than the proxy chain: not forwarded by our proxies
+		self.assertEqual(get_user_ip(self.request('6.6.6.6')), '10.0.0.1')
+
+
+class RateLimitTests(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		self.limit = RateLimit('test', limit=2, period=60)
+
+	def request(self, forwarded=None, session_key=None, **extra):
+		if forwarded:
+			extra['HTTP_X_FORWARDED_FOR'] = forwarded
+		request = RequestFactory().post('/', **{'REMOTE_ADDR': '10.0.0.1', **extra})
+		request.session = SessionStore(session_key)
+		return request
+
+	def test_limit(self):
+		self.assertFalse(self.limit.hit(self.request()))
+		self.assertFalse(self.limit.hit(self.request()))
+		self.assertTrue(self.limit.exceeded(self.request()))
+		self.assertTrue(self.limit.hit(self.request()))
+
+	@override_settings(TRUSTED_PROXY_COUNT=0)
+	def test_spoofed_header_without_proxy(self):
+		for i in range(2):
+			self.limit.hit(self.request(forwarded=f'6.6.6.{i}'))
+		self.assertTrue(self.limit.exceeded(self.request(forwarded='6.6.6.99')))
+
+	@override_settings(TRUSTED_PROXY_COUNT=1)
+	def test_spoofed_header_behind_proxy(self):
+		# A new leftmost entry on every request, the proxy still appends the real IP
+		for i in range(2):
+			self.limit.hit(self.request(forwarded=f'6.6.6.{i}, 1.2.3.4'))
+		self.assertTrue(self.limit.exceeded(self.request(forwarded='6.6.6.99, 1.2.3.4')))
+		self.assertFalse(self.limit.exceeded(self.request(forwarded='6.6.6.99, 5.6.7.8')))
+
+	def test_session_counted_across_ips(self):
+		session = SessionStore()
+		session.create()
+		for i in range(2):
+			self.limit.hit(self.request(session_key=session.session_key, REMOTE_ADDR=f'10.0.1.{i}'))
+		self.assertTrue(self.limit.exceeded(self.request(session_key=session.session_key, REMOTE_ADDR='10.0.1.99')))
+
+	@override_settings(RATELIMIT_ENABLED=False)
+	def test_disabled(self):
+		for _ in range(5):
+			self.assertFalse(self.limit.hit(self.request()))
+		self.assertFalse(self.limit.exceeded(self.request()))
+
+	def test_decorator_response(self):
+		view = self.limit(lambda request: 'ok')
+		view(self.request())
+		view(self.request())
+
+		response = view(self.request())
+		self.assertEqual(response.status_code, 429)
+		self.assertEqual(response['Retry-After'], '60')
+
+		response = view(self.request(HTTP_X_REQUESTED_WITH='XMLHttpRequest'))
+		self.assertEqual(response.status_code, 429)
+		self.assertIn(b'"error"', response.content)
+
+
+class OrderRateLimitTests(TestCase):
+
+	def setUp(self):
+		cache.clear()
+
+	def test_spoofed_header_does_not_reset_orders_limit(self):
+		for _ in range(ORDER_RATE_LIMIT.limit):
+			ORDER_RATE_LIMIT.hit(RequestFactory().post('/', REMOTE_ADDR='127.0.0.1'))
+
+		# New visitor (no session) with a new X-Forwarded-For, same connection IP
+		response = self.client.post(reverse('e_store:create_order'), HTTP_X_FORWARDED_FOR='6.6.6.6')
+		self.assertEqual(response.status_code, 429)
@@ -7,7 +7,9 @@ urlpatterns = [
 	path('', views.home, name='home'),
 	path('items/<slug:item_type_slug>/', views.items, name='items'),
 	path('item/<int:item_id>/', views.item, name='item'),
+	path('item/<int:item_id>/quantity/', views.item_quantity, name='item_quantity'),
 	path('cart/', views.cart, name='cart'),
+	path('cart/item/<int:cart_item_id>/quantity/', views.cart_item_quantity, name='cart_item_quantity'),
 	path('create_order/', views.create_order, name='create_order'),
 	path('edit_order_shipping/<int:order_id>/', views.edit_order_shipping, name='edit_order_shipping'),
 	path('order_success/<int:order_id>/', views.order_success, name='order_success'),
@@ -1,16 +1,239 @@
-from django.db.models import Sum, F
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum, OuterRef, Subquery, Value
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from django.utils.text import slugify
+from django.utils.translation import gettext_lazy as _
+
+from .catalog import bump_catalog_version, bump_stock_revision
 
 
 def available_inventory(inventory):
-	from .models import OrderItem  # Avoid ImportError: circular import models.py utils.py
+	"""Stock not held by confirmed orders, reserved_quantity is kept up to date by Order.save()."""
+	return inventory.quantity - inventory.reserved_quantity
+
+
+def available_inventories(inventories):
+	"""
+	Bulk version of available_inventory(), takes Inventory instances or ids 
+	and returns {inventory_id: available quantity} from a single query.
+	"""
+	from .models import Inventory  # Avoid ImportError: circular import models.py utils.py
+
+	ids = {getattr(inventory, 'pk', inventory) for inventory in inventories if inventory is not None}
+	if not ids:
+		return {}
+
+	return dict(
+		Inventory.objects.filter(id__in=ids).annotate(
+			available=F('quantity') - F('reserved_quantity')
+		).values_list('id', 'available')
+	)
+
+
+def item_page_queryset(item, cart, size=None):
+	"""
+	Every inventory of the item type for the item page: size, 'available' stock 
+	and 'cart_quantity', the quantity of the item in that size already in cart.
+	size only keeps the inventory of that size name (quantity endpoint).
+	"""
+	from .models import Inventory, CartItem
+
+	inventories = Inventory.objects.filter(type=item.type_id).select_related('size').annotate(
+		available=F('quantity') - F('reserved_quantity')
+	)
+	if size is not None:
+		inventories = inventories.filter(size__name=size)
+
+	if cart.pk:
+		cart_quantity = Subquery(
+			CartItem.objects.filter(cart=cart.pk, item=item.pk, inventory=OuterRef('pk')).values('quantity')[:1]
+		)
+		inventories = inventories.annotate(cart_quantity=Coalesce(cart_quantity, 0))
+	else:
+		# Unsaved cart (see views.cart_get), nothing in it
+		inventories = inventories.annotate(cart_quantity=Value(0))
+
+	return inventories.order_by('size_id')
+
+
+def item_page_inventories(item, cart, size=None):
+	"""item_page_queryset() in one query, returns {size name: inventory} in size order."""
+	return {inventory.size.name: inventory for inventory in item_page_queryset(item, cart, size)}
+
+
+def reserve_inventories(quantities):
+	"""
+	Reserve {inventory_id: quantity} for a confirmed order with conditional UPDATEs, 
+	a line is only reserved if quantity >= reserved_quantity + n when the row is written,
+	so concurrent checkouts can't oversell. 
+	All the lines are reserved or none of them, returns the ids of the lines that failed.
+	"""
+	from .models import Inventory
+
+	failed = []
+	with transaction.atomic():
+		# Same row order for every checkout to avoid deadlocks
+		for inventory_id, quantity in sorted(quantities.items()):
+			reserved = Inventory.objects.filter(
+				id=inventory_id, quantity__gte=F('reserved_quantity') + quantity
+			).update(reserved_quantity=F('reserved_quantity') + quantity)
+			
+			if not reserved:
+				failed.append(inventory_id)
+
+		if failed:
+			transaction.set_rollback(True)
+		else:
+			transaction.on_commit(bump_stock_revision)
+
+	return failed
+
+
+def release_inventories(quantities):
+	"""Give back the stock reserved by a confirmed order that is cancelled."""
+	from .models import Inventory
+
+	with transaction.atomic():
+		for inventory_id, quantity in sorted(quantities.items()):
+			Inventory.objects.filter(id=inventory_id).update(
+				reserved_quantity=Greatest(F('reserved_quantity') - quantity, 0)
+			)
+
+		transaction.on_commit(bump_stock_revision)
+
+
+def decrease_inventories(quantities):
+	"""
+	Take reserved stock out of the inventory when an order is printed, 
+	same all or nothing conditional UPDATEs as reserve_inventories().
+	"""
+	from .models import Inventory
+
+	failed = []
+	with transaction.atomic():
+		for inventory_id, quantity in sorted(quantities.items()):
+			decreased = Inventory.objects.filter(id=inventory_id, quantity__gte=quantity).update(
+				quantity=F('quantity') - quantity,
+				reserved_quantity=Greatest(F('reserved_quantity') - quantity, 0),
+			)
+			
+			if not decreased:
+				failed.append(inventory_id)
+
+		if failed:
+			transaction.set_rollback(True)
+		else:
+			transaction.on_commit(bump_stock_revision)
+
+	return failed
+
+
+def clamp_cart_items(inventory_ids):
+	"""
+	Lower the cart items quantities above their inventory quantity with one UPDATE for the whole batch.
+	Cart items are kept to 1 when the inventory is 0, 
+	in the templates the cart item will be disabled until the inventory is available again.
+	"""
+	from .models import Inventory, Cart, CartItem
+
+	inventory_quantity = Subquery(Inventory.objects.filter(id=OuterRef('inventory')).values('quantity')[:1])
+
+	clamped = CartItem.objects.filter(
+		inventory__in=inventory_ids, quantity__gt=F('inventory__quantity')
+	).update(quantity=Greatest(inventory_quantity, 1))
+
+	if clamped:
+		update_cart_item_counts(Cart.objects.filter(cartitem__inventory__in=inventory_ids).distinct())
+		transaction.on_commit(bump_stock_revision)
+
+	return clamped
+
+
+def update_cart_item_counts(carts):
+	"""
+	Bulk version of Cart.update_item_count(), one UPDATE for a queryset of carts
+	and one for the totals of their pending orders.
+	"""
+	from .models import Cart, CartItem, Order
+
+	cart_ids = list(carts.values_list('id', flat=True))
+	item_count = Subquery(
+		CartItem.objects.filter(cart=OuterRef('pk')).values('cart').annotate(total=Sum('quantity')).values('total')
+	)
+	updated = Cart.objects.filter(id__in=cart_ids).update(
+		item_count=Coalesce(item_count, 0), updated_at=timezone.now()
+	)
+
+	cart_total = Subquery(
+		CartItem.objects.filter(cart=OuterRef('cart')).values('cart').annotate(
+			total=Sum(F('quantity') * F('item__price'))
+		).values('total')
+	)
+	Order.objects.filter(cart__in=cart_ids, status="pending").update(total_price=Coalesce(cart_total, 0))
+	return updated
+
+
+def set_inventories(quantities, add=False):
+	"""
+	Restock many inventories from {(type_id, size_id): quantity}, 
+	the matrix is read with one query and written with bulk_update() / bulk_create(),
+	add=True adds the quantities to the stock instead of replacing it.
+	A quantity below the reserved quantity raises ValidationError and nothing is saved.
+	Returns (created, updated) counts.
+	"""
+	from .models import Inventory
+
+	with transaction.atomic():
+		type_ids = {type_id for type_id, size_id in quantities}
+		inventories = {
+			(inventory.type_id, inventory.size_id): inventory 
+			for inventory in Inventory.objects.select_for_update(of=('self',)).filter(type__in=type_ids).select_related('type', 'size')
+		}
+
+		to_create = []
+		to_update = []
+		lowered = []
+		below_reserved = []
+		for (type_id, size_id), quantity in quantities.items():
+			inventory = inventories.get((type_id, size_id))
+			old_quantity = inventory.quantity if inventory else 0
+			new_quantity = old_quantity + quantity if add else quantity
+			if new_quantity < 0:
+				raise ValidationError(_(f"Quantity can't be negative, got {new_quantity} for type {type_id} size {size_id}."))
+
+			# Confirmed orders couldn't be printed anymore (see decrease_inventories)
+			if inventory and new_quantity < inventory.reserved_quantity:
+				below_reserved.append(_(
+					f"{inventory.type} - {inventory.size}: quantity {new_quantity} is below the "
+					f"{inventory.reserved_quantity} reserved by confirmed orders."
+				))
+				continue
+
+			if inventory is None:
+				to_create.append(Inventory(type_id=type_id, size_id=size_id, quantity=new_quantity))
+
+			elif new_quantity != old_quantity:
+				if new_quantity < old_quantity:
+					lowered.append(inventory.id)
+				inventory.quantity = new_quantity
+				to_update.append(inventory)
+
+		if below_reserved:
+			raise ValidationError(below_reserved)
+
+		Inventory.objects.bulk_create(to_create, batch_size=500)
+		Inventory.objects.bulk_update(to_update, ['quantity'], batch_size=500)
+
+		if lowered:
+			clamp_cart_items(lowered)
+
+		if to_create or to_update:
+			# bulk_* don't send signals, invalidate the catalog cache once the stock is committed
+			transaction.on_commit(bump_catalog_version)
 
-	confirmed_quantity = OrderItem.objects.filter(
-		order__status="confirmed", inventory=inventory
-		).aggregate(total=Sum(F('quantity'))
-		)['total'] or 0
-	return inventory.quantity - confirmed_quantity
+	return len(to_create), len(to_update)
 
 
 # Import to models from here to avoid ImportError: circular import
@@ -2,36 +2,49 @@ from django.shortcuts import render, redirect, get_object_or_404
 from .models import Item, CartItem, Cart, Inventory, Order, OrderItem, BlackListedPhone, Display, Shipping, Size, ItemType
 from .forms import AddToCartForm, OrderForm, CartItemForm
 from django.contrib import messages
-from datetime import timedelta
-from django.utils import timezone
-from django.http import HttpResponseForbidden, Http404
-from django.utils.translation import gettext as _
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext as _, gettext_lazy
 from django.urls import reverse
-from django.db.models import Q, F, Sum
-from .utils import available_inventory
-from django.conf import settings
-
-def get_user_ip(request):
-    # Check for IP address in the 'X-Forwarded-For' header (used when behind a proxy)
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        # Take the first IP if there are multiples
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        # Or get the direct IP address
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+from django.db.models import Prefetch, prefetch_related_objects
+from .utils import available_inventory, item_page_inventories
+from .catalog import get_displays, get_item_type, get_items, get_item, catalog_version, parse_items_cursor, ITEM_SORTS
+from .page_cache import cache_page, conditional_page
+from .ratelimit import RateLimit, get_user_ip
+
+# Rate limits of the mutations, counted in the cache per IP and per session (see ratelimit.py)
+CART_RATE_LIMIT = RateLimit('cart', limit=60, period=60)
+QUANTITY_RATE_LIMIT = RateLimit('quantity', limit=120, period=60)
+CHECKOUT_RATE_LIMIT = RateLimit('checkout', limit=20, period=5 * 60)
+# Orders created, only counted when an order is saved
+ORDER_RATE_LIMIT = RateLimit('order', limit=2, period=5 * 60, message=gettext_lazy("Too many orders. Try again later."))
+
+def cart_get(request):
+	"""
+	Return the visitor's cart, or an empty unsaved Cart() if there is none yet: 
+	browsing never writes a cart or the session, see cart_get_create().
+	"""
+	# The view and the context processor share the same cart instance
+	if hasattr(request, 'cart'):
+		return request.cart
+
+	cart = None
+	cart_id = request.session.get('session_cart_id')
+	if cart_id:
+		cart = Cart.objects.filter(id=cart_id).first()
+
+	request.cart = cart or Cart()
+	return request.cart
 
 def cart_get_create(request):
-	cart_id = request.session.get('session_cart_id')
-	cart, created = Cart.objects.get_or_create(id=cart_id)
+	"""Only called when adding to cart, saves the cart and stores its id in session."""
+	cart = cart_get(request)
 	
-	if created: # store new cart id in session
+	if not cart.pk: 
+		cart.save()
+		# Store new cart id in session, replaces the id of a cart that no longer exists 
 		request.session['session_cart_id'] = cart.id 
-	
-	elif cart_id and created: # delete session storing card id if cart instance no longer exists 
-		del request.session['session_cart_id']
-		request.session['session_cart_id'] = cart.id				
 
 	return cart
 
@@ -45,6 +58,7 @@ def check_order_owner(request, order_id):
 		return redirect("e_store:cart")
  	
 	order = get_object_or_404(Order, id=order_id, cart=cart)
+	order.cart = cart
 
 	return order
 
@@ -52,8 +66,10 @@ def check_pending_order(order):
 	if order.status != "pending":
 		raise Http404
 
+@conditional_page()
+@cache_page()
 def home(request):
-	displays = Display.objects.all()
+	displays = get_displays()
 	displays_urls = []
 	for display in displays:
 		url = reverse('e_store:items', args=[display.type.slug])
@@ -66,54 +82,67 @@ def home(request):
 	
 	return render(request, 'e_store/home.html', context)
 
+@conditional_page()
+@cache_page(params=('sort', 'after'))
 def items(request, item_type_slug):
-	item_type = get_object_or_404(ItemType, slug=item_type_slug)
-	items = Item.objects.filter(type=item_type)
-
-	# Sort items GET request
-	session_sort = request.session.get('session_sort')
-	if session_sort:
-		items = items.order_by(session_sort)
+	item_type = get_item_type(item_type_slug)
+	if item_type is None:
+		raise Http404
 
-	# Sort items POST request
-	if request.method == 'POST':
-		sort = request.POST.get('sort')
-		items = items.order_by(sort) 
-		request.session['session_sort'] = sort
-		session_sort = request.session.get('session_sort')	
+	fields = [
+		('name', _('name ↑')), 
+		('-name', _('name ↓')), 
+		('price', _('price ↑')), 
+		('-price', _('price ↓'))
+	]
+
+	# Sort and page are GET parameters so listing urls can be linked and cached,
+	# only known sorts are passed to order_by() and used in cache keys
+	sort = request.GET.get('sort')
+	if sort not in ITEM_SORTS:
+		sort = ITEM_SORTS[0]
+
+	# A tampered cursor or one of another sort shows the first page
+	cursor = request.GET.get('after')
+	if parse_items_cursor(cursor, sort) is None:
+		cursor = None
+	items, next_cursor = get_items(item_type, sort, cursor)
 	
 	context = {
 		'items': items,
 		'title': item_type,
-		'fields': [
-			('name', _('name ↑')), 
-			('-name', _('name ↓')), 
-			('price', _('price ↑')), 
-			('-price', _('price ↓'))
-		],
-		'session_sort': session_sort,	
+		'fields': fields,
+		'sort': sort,
+		'cursor': cursor,
+		'next_cursor': next_cursor,
+		'catalog_version': catalog_version(),  # Product card fragments cache key
 	}
 	
 	return render(request, 'e_store/items.html', context)
 
 
+@conditional_page(stock=True)
+@CART_RATE_LIMIT
 def item(request, item_id):
-	item = get_object_or_404(Item, id=item_id)
-	cart = cart_get_create(request)
+	item = get_item(item_id)
+	if item is None:
+		raise Http404
+	cart = cart_get(request)
 
 	selected_size = None
-	cart_item = None
+	cart_quantity = 0
 	increase_button_disabled = None
 	decrease_button_disabled = None
 
+	# Sizes with their available stock and the quantity already in the cart, one query for the whole page
+	inventories = item_page_inventories(item, cart)
+
 	if request.method == 'POST':
 		# Display quantity in cart message when pressing size button  
 		selected_size = request.POST.get('size')
-		# Use filter() to avoid handling missing objects
-		item_type = ItemType.objects.filter(type=item.type).first()
-		size = Size.objects.filter(name=selected_size).first()
-		inventory = Inventory.objects.filter(size=size, type=item_type).first()
-		cart_item = CartItem.objects.filter(item=item, inventory=inventory, cart=cart).first() 
+		inventory = inventories.get(selected_size)
+		if inventory:
+			cart_quantity = inventory.cart_quantity
 
 		# Handle + - buttons
 		quantity_raw = request.POST.get('quantity')
@@ -122,37 +151,33 @@ def item(request, item_id):
 		except (ValueError, TypeError):
 			quantity = None
 		
-		if request.POST.get('adjust_quantity') == 'increase':
-			quantity = min(quantity + 1, available_inventory(inventory))
-
-		elif request.POST.get('adjust_quantity') == 'decrease':
-			quantity = max(quantity - 1, 1) 
-
-		# Set quantity max_value to 1 when selected size change  
-		session_selected_size = request.session.get('selected_size')    
-		if selected_size != session_selected_size:  # Compare current selected size with the previous session
+		if quantity is not None and inventory:
+			if request.POST.get('adjust_quantity') == 'increase':
+				quantity = min(quantity + 1, inventory.available)
+
+			elif request.POST.get('adjust_quantity') == 'decrease':
+				quantity = max(quantity - 1, 1) 
+
+		# Set quantity max_value to 1 when selected size change.
+		# The hidden size input holds the size the page was rendered with and comes before the size buttons,
+		# so a clicked size button is the last value and the previous size the first, nothing is kept in the session
+		previous_size = request.POST.getlist('size')[0] if 'size' in request.POST else None
+		if selected_size != previous_size:
 			quantity = 1
-		request.session['selected_size'] = request.POST.get('size')  # Selected size session update
 		
 		form = AddToCartForm(
 			data={**request.POST.dict(), 'quantity': quantity},  
 			item=item,
 			selected_size=selected_size,
-			cart=cart
+			cart=cart,
+			inventories=inventories,
 		)		
 		# Disable + - buttons
 		if 'add_to_cart' not in request.POST: 
 			if form.is_valid():
 				quantity = form.cleaned_data['quantity']
 				
-				if ( 
-					cart_item and ( 
-						quantity + cart_item.quantity == available_inventory(inventory) 
-					) or (
-						quantity == available_inventory(inventory)
-					)
-				
-				):
+				if quantity + cart_quantity == inventory.available:
 					increase_button_disabled = True  
 					form.add_error('quantity', "Max quantity.")
 
@@ -166,47 +191,36 @@ def item(request, item_id):
 
 		if 'add_to_cart' in request.POST: 
 			if form.is_valid():
-				size = form.cleaned_data['size']
 				quantity = form.cleaned_data['quantity']
 
-				try:
-					size = Size.objects.get(name=selected_size)
-				except Size.DoesNotExist:
-					messages.error(request, _("The selected size is unavailable for now, please select another size."))
+				if inventory is None:
+					messages.error(request, _("This item is out of stock."))
 				
-				try:
-					inventory = Inventory.objects.get(type=item_type, size=size)
+				else:
+					cart = cart_get_create(request)
 					cart_item, created = CartItem.objects.get_or_create(
 						item=item,
-						item_name=item.name,
 						inventory=inventory,
 						cart=cart,
+						defaults={'item_name': item.name, 'quantity': quantity},
 					)
-					if created:
-						cart_item.quantity = quantity
-					else: 
+					# A new line is saved once with its quantity
+					if not created: 
 						cart_item.quantity += quantity
-
-					cart_item.save()
+						cart_item.save()
 
 					messages.success(request, _("Item added to cart."))
 					return redirect('e_store:item', item.id)
-
-				except Inventory.DoesNotExist:
-					messages.error(request, _("This item is out of stock."))
 	
 	else:	
-		form = AddToCartForm(item=item, selected_size=selected_size, cart=cart)
-		size_choices = form.fields['size'].choices
-
-	inventories = Inventory.objects.filter(type=item.type)
+		form = AddToCartForm(item=item, selected_size=selected_size, cart=cart, inventories=inventories)
 
 	context = {
 		'item': item,
 		'form': form,
 		'sizes_quantities': form.sizes_quantities,
-		'in_stock': inventories.filter(quantity__gt=0).exists(),
-		'cart_item': cart_item,
+		'in_stock': any(inventory.available > 0 for inventory in inventories.values()),
+		'cart_quantity': cart_quantity,
 		'increase_button_disabled': increase_button_disabled,
 		'decrease_button_disabled': decrease_button_disabled,
 		'selected_size': selected_size,
@@ -217,22 +231,125 @@ def item(request, item_id):
 
 	return render(request, 'e_store/item.html', context)
 
+@require_POST
+@QUANTITY_RATE_LIMIT
+def item_quantity(request, item_id):
+	"""
+	JSON version of the size and + - buttons of the item page, only the selected size is loaded and validated.
+	Returns the quantity to show with its limits, the page POST in item() stays the fallback without javascript.
+	"""
+	item = get_item(item_id)
+	if item is None:
+		raise Http404
+	cart = cart_get(request)
+
+	size = request.POST.get('size')
+	inventory = item_page_inventories(item, cart, size=size).get(size) if size else None
+	if inventory is None or inventory.available <= 0:
+		return JsonResponse(
+			{'error': _("The selected size is unavailable for now, please select another size.")}, status=400
+		)
+
+	try:
+		quantity = int(request.POST.get('quantity'))
+	except (ValueError, TypeError):
+		quantity = 1
+
+	if request.POST.get('adjust_quantity') == 'increase':
+		quantity += 1
+	elif request.POST.get('adjust_quantity') == 'decrease':
+		quantity -= 1
+
+	max_quantity = max(inventory.available - inventory.cart_quantity, 0)
+	quantity = max(min(quantity, max_quantity), 1)
+
+	error = None
+	if max_quantity == 0:
+		error = _("Available stock already in the cart.")
+	elif quantity == max_quantity and request.POST.get('adjust_quantity') == 'increase':
+		error = _("Max quantity.")
+
+	return JsonResponse({
+		'size': size,
+		'quantity': quantity,
+		'max_quantity': max_quantity,
+		'cart_quantity': inventory.cart_quantity,
+		'decrease_disabled': quantity <= 1,
+		'increase_disabled': quantity >= max_quantity,
+		'error': error,
+	})
+
+@require_POST
+@QUANTITY_RATE_LIMIT
+def cart_item_quantity(request, cart_item_id):
+	"""
+	JSON version of the + - buttons and quantity input of the cart page, only the changed line is validated and saved.
+	Returns the line and cart totals, the page POST in cart() stays the fallback without javascript.
+	"""
+	cart = cart_get(request)
+	if not cart.pk:
+		raise Http404
+
+	try:
+		# Through the cart: only the visitor's items
+		cart_item = cart.cartitem_set.select_related('item', 'inventory').get(id=cart_item_id)
+	except CartItem.DoesNotExist:
+		raise Http404
+
+	if cart_item.item is None or cart_item.inventory is None:
+		return JsonResponse({'error': _("Item no longer available")}, status=400)
+
+	max_available = available_inventory(cart_item.inventory)
+	adjust_quantity = request.POST.get('adjust_quantity')
+	if adjust_quantity == 'increase':
+		new_quantity = min(cart_item.quantity + 1, max_available)
+	elif adjust_quantity == 'decrease':
+		new_quantity = max(cart_item.quantity - 1, 1)
+	else:
+		new_quantity = request.POST.get('quantity')
+
+	error = None
+	status = 200
+	form = CartItemForm({'quantity': new_quantity}, instance=cart_item)
+	if form.is_valid():
+		form.save()
+		if cart_item.quantity == max_available:
+			error = _("Max quantity.")
+	else:
+		# The quantity isn't saved, send back the one in the cart.
+		# Stock errors of CartItem.clean() are non field errors
+		error = next(iter(form.errors.values()))[0]
+		status = 400
+		cart_item.refresh_from_db(fields=['quantity'])
+
+	return JsonResponse({
+		'quantity': cart_item.quantity,
+		'max_quantity': max_available,
+		'decrease_disabled': cart_item.quantity <= 1,
+		'increase_disabled': cart_item.quantity >= max_available,
+		'line_total': f'{cart_item.total_price():.2f}',
+		'cart_total': f'{cart.total_price():.2f}',
+		'cart_item_count': cart.item_count,
+		'error': error,
+	}, status=status)
+
+@CART_RATE_LIMIT
 def cart(request):     
-	# cart is created for the first time when: visiting item page or cart page
-	cart = cart_get_create(request)
+	# cart is created for the first time when adding an item to the cart
+	cart = cart_get(request)
 
-	# Check if customer has a pending order and display a message instead of add to cart button
-	cart_id = request.session.get('session_cart_id')
-	cart = Cart.objects.filter(id=cart_id).first()  
-	pending_order = Order.objects.filter(cart=cart, status="pending").first()
+	pending_order = None
+	if cart.pk:
+		# Check if customer has a pending order and display a message instead of add to cart button
+		pending_order = Order.objects.filter(cart=cart, status="pending").first()
 
-	cart_items = cart.cartitem_set.all()
+		cart_items = cart.cartitem_set.all()
 
 	forms = []
 
 	error_form = None
 
-	if request.method == 'POST':  
+	if request.method == 'POST' and cart.pk:  
 		cart_item_id = request.POST.get('cart_item_id')
 		# Quantity change
 		adjust_quantity = request.POST.get('adjust_quantity')  # Change from - + buttons
@@ -241,15 +358,15 @@ def cart(request):
 		delete_cart_item = request.POST.get('delete_cart_item')
 		
 		try:
-			cart_item = CartItem.objects.get(id=cart_item_id)
+			# Through the cart: only the visitor's items, and cart_item.cart is this cart instance (navbar count)
+			cart_item = cart.cartitem_set.get(id=cart_item_id)
 
 			# Remove button
 			if delete_cart_item:
 				cart_item.delete()
 				# Check for pending order and cancel it if the cart is empty
 				if not cart_items and pending_order:
-					pending_order.status = "cancelled"
-					pending_order.save()
+					pending_order.change_status("cancelled")
 					messages.success(request, _("Order canceled successfully."))
 				return redirect("e_store:cart")
 
@@ -280,40 +397,44 @@ def cart(request):
 			messages.error(request, "Could not find the item.")
 		
 	# Add the updated form instance: cart_item.id to the forms list in order to display field errors      
-	for cart_item in cart_items:
+	unavailable_inventory_item = False
+	total_price = 0  # Summed from the lines already loaded instead of a query each time the template needs it
+	for cart_item, available in cart.items_with_availability():
 		if error_form and error_form.instance.id == cart_item.id:
-			forms.append((error_form, cart_item, available_inventory(cart_item.inventory)))
+			forms.append((error_form, cart_item, available))
 		else:
-			forms.append((CartItemForm(instance=cart_item), cart_item, available_inventory(cart_item.inventory)))  
+			forms.append((CartItemForm(instance=cart_item), cart_item, available))  
+
+		if cart_item.item is None or cart_item.inventory is None or cart_item.quantity > available:
+			unavailable_inventory_item = True
+
+		if cart_item.item is not None:
+			total_price += cart_item.total_price()
 	
 	context = { 
 		'forms': forms,
-		'cart': cart,  # for total price and "cart is empty" message
+		'cart': cart,
+		'total_price': total_price,  # for total price and "cart is empty" message
 		'pending_order': pending_order,
-		'unavailable_inventory_item': cart_items.filter(
-			Q(quantity__gt=F('inventory__quantity')) | Q(inventory__isnull=True) | Q(item__isnull=True)
-		),
+		'unavailable_inventory_item': unavailable_inventory_item,
 		'title': 'Cart',
 		
 	}
 
 	return render(request, 'e_store/cart.html', context) 
 
+@CHECKOUT_RATE_LIMIT
 def create_order(request):
-	cart = cart_get_create(request)
+	# Limit orders by IP and session, checked in the cache before any query
+	if ORDER_RATE_LIMIT.exceeded(request):
+		return ORDER_RATE_LIMIT.response(request)
+
+	cart = cart_get(request)
 	
 	# Block access to the page if cart is empty, or if there is a pending order 
 	if cart.is_empty() or Order.objects.filter(cart=cart, status="pending").exists():
 		raise Http404
 
-	# Limit orders by IP
-	user_ip = get_user_ip(request)
-	time_limit = timezone.now() - timedelta(minutes=5)
-	order_count = Order.objects.filter(ip_address=user_ip, created_at__gte=time_limit).count()
-
-	if order_count >= 2:
-		return HttpResponseForbidden(_("Too many orders. Try again later."))
-	
 	try:
 		# Prefill the form
 		latest_order = Order.objects.filter(cart=cart).latest('created_at')
@@ -340,7 +461,9 @@ def create_order(request):
 			order.cart = cart
 			order.status = "pending"
 			order.total_price = cart.total_price()
+			order.ip_address = get_user_ip(request)
 			order.save()
+			ORDER_RATE_LIMIT.hit(request)
 				
 			return redirect("e_store:order", order.id)
 	
@@ -392,72 +515,57 @@ def order(request, order_id):
 
 		# Confirm order button
 		if confirm_order:
-			# Check if stock in item are available 
-			cart_items = order.cart.cartitem_set.all()
-			for cart_item in cart_items:
-				if cart_item.quantity > available_inventory(cart_item.inventory) or cart_item.inventory is None: 
-					messages.error(request, _("One or more items in your cart are out of stock. Please review your cart."))
-					return redirect(request, "e_store:cart")
+			check_pending_order(order)
 
-				elif cart_item.item is None:
+			# Check if stock in item are available 
+			cart_items = order.cart.items_with_availability()
+			for cart_item, available in cart_items:
+				if cart_item.item is None:
 					messages.error(request, _("One or more items are no longer available, Please review your cart."))
-					return redirect(request, "e_store:cart")
-
-			# Create order items
-			if order.status == "pending" and not order.orderitem_set.exists():
-				OrderItem.objects.create(
-					item=cart_item.item,
-					item_name=cart_item.item.name,
-					inventory=cart_item.inventory,
-					quantity=cart_item.quantity,
-					total_price=cart_item.total_price(),
-					order=order
-				)
-
-			# Change order status from pending to confirmed
-			order.status = "confirmed"
-			order.save()
+					return redirect("e_store:cart")
 
-			# Create shipping instance when order is confirmed
-			Shipping.objects.create(order=order)
+				elif cart_item.inventory is None or cart_item.quantity > available: 
+					messages.error(request, _("One or more items in your cart are out of stock. Please review your cart."))
+					return redirect("e_store:cart")
 
-			# Clear cart after order is confirmed
-			cart_items.delete()
+			# Order items, stock reservation, shipping and cart clearing are saved with the status,
+			# if a line can't be reserved (sold out by a concurrent checkout) nothing is saved
+			try:
+				order.change_status("confirmed")
+			except ValidationError as e:
+				for message in e.messages:
+					messages.error(request, message)
+				return redirect("e_store:cart")
 
 			request.session['success'] = True
 
-			if not settings.DEBUG:
-				messages.warning(request, "📧 Email notifications are temporarily unavailable. We’re working to restore them soon.")	
-			
 			return redirect('e_store:order_success', order_id=order.id)
 
 		# Cancel order button
 		else:
-			try:
-				order = Order.objects.get(id=order_id)
-				if order.status not in ['pending', 'confirmed']:
-					messages.error(request, _("You cannot cancel this order."))
-
-				else:
-					if order.status == 'pending':
-						# Delete cart items if order is "pending"
-						cart_items = order.cart.cartitem_set.all().delete()
-					
-					order.status = 'cancelled'
-					order.save()
-
-					# Delete shipping instance when order is canceled
-					Shipping.objects.filter(order=order).delete()
+			if order.status not in ['pending', 'confirmed']:
+				messages.error(request, _("You cannot cancel this order."))
 
+			else:
+				# Cart items of a pending order and the shipping instance are deleted with the status change
+				try:
+					order.change_status('cancelled')
 					messages.success(request, _("Order canceled successfully."))
-					
-					if not settings.DEBUG:
-						messages.warning(request, "📧 Email notifications are temporarily unavailable. We’re working to restore them soon.")						
-				
-				return redirect('e_store:order', order_id=order.id)
+				except ValidationError as e:
+					for message in e.messages:
+						messages.error(request, message)
 			
-			except Order.DoesNotExist:
-				pass  
+			return redirect('e_store:order', order_id=order.id)
+
+	# Lines with their item and size in one query instead of three per line
+	if order.status == 'pending':
+		prefetch_related_objects([order.cart], Prefetch(
+			'cartitem_set', queryset=CartItem.objects.select_related('item', 'inventory__size')
+		))
+	else:
+		prefetch_related_objects([order], Prefetch(
+			'orderitem_set', queryset=OrderItem.objects.select_related('item', 'inventory__size')
+		))
 
 	context = {
 		'order': order,
@@ -482,8 +590,8 @@ def order_success(request, order_id):
 	return render(request, "e_store/order_success.html", context)
 
 def order_history(request):
-	cart = cart_get_create(request)
-	orders = Order.objects.filter(cart=cart)	
+	cart = cart_get(request)
+	orders = Order.objects.filter(cart=cart) if cart.pk else Order.objects.none()	
 	context = {
 		'orders': orders,
 		'title': 'Order history',
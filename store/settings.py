@@ -189,10 +189,34 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'   
+# Emails are queued in e_store.OutgoingEmail and sent by `python manage.py send_emails`
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')   
+
+# Cache for the catalog, the page validators and the rate limits, it must be shared by every worker:
+# the database cache by default in production (run createcachetable), or CACHE_BACKEND and CACHE_LOCATION
+# for memcached, redis... locmem is per process, only the default in development (see e_store.checks)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default=(
+            'django.core.cache.backends.locmem.LocMemCache' if DEBUG
+            else 'django.core.cache.backends.db.DatabaseCache'
+        )),
+        'LOCATION': config('CACHE_LOCATION', default='e_store' if DEBUG else 'e_store_cache'),
+    }
+}
+
+# Number of proxies in front of the app appending the client IP to X-Forwarded-For (1 on Heroku),
+# the rate limits and Order.ip_address only trust those entries (see e_store.ratelimit.get_user_ip)
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=0, cast=int)
+
+# Turns off the rate limits (e_store.ratelimit) for load tests, see benchmark_journey. Never in production
+RATELIMIT_ENABLED = config('RATELIMIT_ENABLED', default=True, cast=bool)
 
 # Set session to expire in 30 days 
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 30 
+# Sessions are read from the cache, the database is only the fallback when an entry is evicted.
+# They only hold the cart id and the order success flag, UI state (size, sort) is in the forms and urls
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 # To build urls in e_store.email_utils
 SITE_ID = 1  